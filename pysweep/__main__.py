@@ -1,9 +1,17 @@
 #!/usr/bin/python3
 
-from .display import Display, DisplayImage, TileState
+import os
+
+from .display import Display, DisplayImage, TileState, FaceState, Counter
+from .game import Game
+from .input import InputPipeline
 
 from .skin import Skin
 from .dirstruct import Multi, Dir
+from .latency import LatencyTracker
+from .framebuffer import FrameBuffer, MappedDisplayImage
+from .layoutcache import LayoutCache
+from .renderprofile import RenderProfile
 
 def pushwindowtotop(): # pragma: no cover
     import os, platform, sys
@@ -35,13 +43,70 @@ def main(): # pragma: no cover
     skindir = 'images_d_tiles'
     skin = Skin(Multi(Dir(skindir), Dir('images')))
     skin.preload_skin()
-    displaycanvas = DisplayCanvas(tk, skin)
+    tracker = LatencyTracker.from_environ()
+    backend = os.environ.get('PYSWEEP_BACKEND')
+    if backend == 'items':
+        from .itemcanvas import ItemDisplayCanvas
+        displaycanvas = ItemDisplayCanvas(tk, Display(DisplayImage(None), skin), tracker=tracker)
+    elif backend == 'thread':
+        from .renderthread import ThreadedDisplayCanvas
+        displaycanvas = ThreadedDisplayCanvas(tk, Display(DisplayImage(None), skin), tracker=tracker)
+    else:
+        displaycanvas = DisplayCanvas(tk, skin, tracker=tracker,
+            framebuffer=os.environ.get('PYSWEEP_FRAMEBUFFER'),
+            layoutcache=LayoutCache.from_environ())
     displaycanvas.pack()
-
-    displaycanvas.display.draw()
-    displaycanvas.display.tiles[2][4].state = TileState.Number[4]
-    displaycanvas.display.tiles[2][4].draw()
-    displaycanvas.draw()
+    RenderProfile.from_environ(displaycanvas.display)
+
+    display = displaycanvas.display
+    if backend == 'thread':
+        # The display belongs to the render thread now
+        set_state = displaycanvas.renderer.set_state
+    else:
+        def set_state(target, state):
+            target.state = state
+            if isinstance(target, Counter):
+                target.draw_changed()
+            else:
+                target.draw()
+        display.draw()
+        displaycanvas.draw()
+
+    mines = 99
+    game = Game(len(display.tiles), len(display.tiles[0]), mines)
+    set_state(display.lcounter, game.minesleft)
+
+    def handle(action):
+        nonlocal game
+        if action.kind == 'face':
+            for i, row in enumerate(game.tiles):
+                for j, state in enumerate(row):
+                    if state is not TileState.Unopened:
+                        set_state(display.tiles[i][j], TileState.Unopened)
+            game = Game(game.rows, game.cols, mines)
+            set_state(display.lcounter, game.minesleft)
+            set_state(display.face, FaceState.Happy)
+        elif action.kind in ('open', 'flag', 'chord'):
+            if game.finished:
+                return
+            for row, col, state in game.act(action.kind, *action.target[1:]):
+                set_state(display.tiles[row][col], state)
+            set_state(display.lcounter, game.minesleft)
+            set_state(display.face, {'won': FaceState.Cool, 'lost': FaceState.Blast}.get(game.status, FaceState.Happy))
+        elif action.kind in ('press', 'move'):
+            if action.target == ('face',):
+                set_state(display.face, FaceState.Pressed)
+            elif not game.finished:
+                set_state(display.face, FaceState.Nervous)
+        elif action.kind == 'cancel':
+            if not game.finished:
+                set_state(display.face, FaceState.Happy)
+        if backend != 'thread':
+            displaycanvas.draw()
+
+    pipeline = InputPipeline(display, handle, tracker=tracker)
+    pipeline.bind(displaycanvas)
+    pipeline.schedule(displaycanvas)
 
     pushwindowtotop()
     tk.mainloop()
@@ -57,16 +122,23 @@ try: # pragma: no cover
     from PIL import Image, ImageTk
     import tkinter
 
+    from .minimap import upload_boxes
+
     # Hack to look at the screen. I stole this from the previous code :P
     class DisplayCanvas(tkinter.Canvas):
         """ Puts the Display Part onto a Canvas """
-        def __init__(self, master, skin):
+        def __init__(self, master, skin, tracker=None, zoom=None, framebuffer=None, layoutcache=None):
             self.master = master
             self.skin = skin
+            self.tracker = tracker # latency.LatencyTracker, optional
+            self.framebufferpath = framebuffer # Path to export frames to, optional
 
-            self.displayimg = DisplayImage(None)
+            self.displayimg = MappedDisplayImage(None)
 
-            self.display = Display(self.displayimg, skin)
+            if layoutcache is not None:
+                self.display = layoutcache.display(self.displayimg, skin, zoom=zoom)
+            else:
+                self.display = Display(self.displayimg, skin, zoom=zoom)
 
             self.size = self.display.size
 
@@ -75,12 +147,53 @@ try: # pragma: no cover
             self.img = Image.new(size=self.size, mode="RGBA")
             self.tkimg = ImageTk.PhotoImage(self.img)
             self.displayimg.pil_image = self.img
-            self.create_image(0, 0, image=self.tkimg, anchor='nw')
+            self.imageitem = self.create_image(0, 0, image=self.tkimg, anchor='nw')
+            self.open_framebuffer()
 
             self.display.draw()
             self.draw()
 
+        def set_zoom(self, zoom):
+            """ Switches the display to the skin resampled for zoom in place, keeping all states """
+            self.resized(self.display.set_skin(self.skin, zoom))
+
+        def set_skin(self, skin):
+            """ Switches the display to skin in place, see skinset.SkinSet for prewarming """
+            self.skin = skin
+            self.resized(self.display.set_skin(skin))
+
+        def resized(self, changed):
+            """ Redraws after set_skin, first making a new image if the display changed size """
+            if changed:
+                self.size = self.display.size
+                self.config(width=self.size[0], height=self.size[1])
+                self.img = Image.new(size=self.size, mode="RGBA")
+                self.tkimg = ImageTk.PhotoImage(self.img)
+                self.displayimg.pil_image = self.img
+                self.itemconfigure(self.imageitem, image=self.tkimg)
+                self.open_framebuffer()
+            self.display.draw()
+            self.draw()
+
+        def open_framebuffer(self):
+            """ (Re)creates the exported framebuffer at the current size """
+            if self.framebufferpath is None:
+                return
+            framebuffer = self.displayimg.framebuffer
+            if framebuffer is None:
+                framebuffer = FrameBuffer.create_file(self.framebufferpath, self.size)
+            else:
+                # Readers may have it mapped, so a new file is put in its place for them to follow
+                framebuffer = framebuffer.resize(self.size)
+            self.displayimg.framebuffer = framebuffer
+            self.displayimg.invalidate((0, 0) + self.size)
+
         def draw(self):
-            self.tkimg.paste(self.img)
+            if self.tracker is not None:
+                self.tracker.mark('redraw')
+            # publish takes the dirty rectangles, so the same ones go to Tk
+            upload_boxes(self.tkimg, self.img, self.displayimg.publish())
+            if self.tracker is not None:
+                self.tracker.mark('present')
 except: # pragma: no cover
     pass
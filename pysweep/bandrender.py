@@ -0,0 +1,201 @@
+"""
+Multi-process band rendering for giant boards
+
+The board is split into horizontal bands of tile rows.
+Each worker process builds the same Display layout once (loading the skin once),
+and compiles a display list for each band it is given:
+the band's part of the static layer, and where each of its tiles goes.
+Workers draw straight into a framebuffer in multiprocessing.shared_memory,
+seen through an image sharing its memory (see framebuffer_image),
+so drawing a band is one paste of its static layer and one paste per tile,
+with nothing copied afterwards.
+
+The parent never touches the board. It draws the chrome above and below the board
+when the layout or skin changes, and the panel sprites each frame,
+into the same framebuffer, which it hands out as the frame.
+
+Tile states are passed to the workers as bytes of their codes (see TileState.STATES).
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory, util
+
+from PIL import Image
+
+from .display import Display, DisplayImage, FaceState, TileState, blit
+
+
+def default_skin():
+    from .skin import Skin
+    from .dirstruct import Multi, Dir
+    return Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+
+def framebuffer_image(buf, size):
+    """ An RGBA image of size whose pixels are buf itself, so pasting into it writes to buf """
+    img = Image.frombuffer('RGBA', size, buf, 'raw', 'RGBA', 0, 1)
+    # frombuffer marks it read only, which would make paste copy it first and write to the copy
+    img.readonly = 0
+    return img
+
+""" Worker processes """
+
+_worker = None # (display, shared memory, framebuffer image, map of (first, rows) to band_list) of this worker process
+
+def _init_worker(skin_factory, displayargs, shmname):
+    global _worker
+    skin = skin_factory()
+    skin.preload_skin()
+    # Workers share the parent's resource tracker, so only the parent's unlink cleans this up
+    shm = shared_memory.SharedMemory(name=shmname)
+    display = Display(DisplayImage(None), skin, **displayargs)
+    _worker = (display, shm, framebuffer_image(shm.buf, display.size), {})
+    util.Finalize(None, _close_worker, exitpriority=10)
+
+def _close_worker():
+    global _worker
+    shm = _worker[1]
+    _worker = None # Let go of the framebuffer image before closing the memory it uses
+    shm.close()
+
+def _render_band(first, rows, codes):
+    display, shm, frame, lists = _worker
+    try:
+        bandlist = lists[(first, rows)]
+    except KeyError:
+        bandlist = lists[(first, rows)] = band_list(display, first, rows)
+    draw_band(bandlist, codes, frame)
+    return first
+
+def band_list(display, first, rows):
+    """
+    The display list of the tile rows first to first+rows:
+    (base, (x, y), coords, blits) where base is the static layer under the full width rows they cover,
+    at x, y, coords the place of each tile, row by row,
+    and blits the blit entry (img, None, mask) for each tile state code.
+    """
+    tiles = display.tiles[first:first + rows]
+    y1 = tiles[0][0].offset[1]
+    y2 = tiles[-1][0].boxcoords[3]
+    base = display.static_layer().crop((0, y1, display.size[0], y2))
+    coords = [tile.offset for row in tiles for tile in row]
+    blits = [blit(img, None) for img in tiles[0][0].table]
+    return base, (0, y1), coords, blits
+
+def draw_band(bandlist, codes, frame):
+    """
+    Draws the tiles of bandlist (see band_list) with the state codes in codes (bytes, row by row)
+    into the image frame of the whole display.
+    """
+    base, xy, coords, blits = bandlist
+    # Tiles with transparency are drawn over the chrome under them, as in a full draw
+    paste = frame.paste
+    paste(base, xy)
+    for xy, code in zip(coords, codes):
+        img, _, mask = blits[code]
+        paste(img, xy, mask)
+
+""" Parent process """
+
+class BandRenderer:
+    """
+    Renders whole frames of a board with a pool of processes.
+
+        >>> states = [[TileState.Number[(i + j) % 9] for j in range(7)] for i in range(5)]
+        >>> with BandRenderer(boardrows=5, boardcols=7, processes=2) as renderer:
+        ...     img = renderer.render(states, lcounter=12, rcounter=345).copy()
+        ...     states[0][0] = TileState.Flag
+        ...     again = renderer.render(states, lcounter=13, rcounter=345).copy()
+
+    The frames are the same as drawing on a single core
+        >>> skin = default_skin()
+        >>> displayimg = DisplayImage(None)
+        >>> display = Display(displayimg, skin, boardrows=5, boardcols=7)
+        >>> displayimg.pil_image = Image.new(size=display.size, mode="RGBA")
+        >>> for row, rowstates in zip(display.tiles, states):
+        ...     for tile, state in zip(row, rowstates):
+        ...         tile.state = state
+        >>> display.lcounter.state, display.rcounter.state = 13, 345
+        >>> display.draw()
+        >>> again.tobytes() == displayimg.pil_image.tobytes()
+        True
+        >>> display.tiles[0][0].state, display.lcounter.state = TileState.Number[0], 12
+        >>> display.draw()
+        >>> img.tobytes() == displayimg.pil_image.tobytes()
+        True
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, skin_factory=default_skin, processes=None, bands=None, **displayargs):
+        skin = skin_factory()
+        self.display = display = Display(DisplayImage(None), skin, **displayargs)
+        self.rows = len(display.tiles)
+        self.processes = processes or multiprocessing.cpu_count()
+        # A few bands per process keeps them busy when bands take different times
+        self.bands = min(bands or self.processes * 4, self.rows)
+
+        width, height = display.size
+        self.shm = shared_memory.SharedMemory(create=True, size=width * height * 4)
+        self.frame = framebuffer_image(self.shm.buf, display.size)
+        self._chrome = None # The static layer last drawn into the framebuffer
+        self._shown = {} # Map of panel sprite to the image last drawn for it
+        self.pool = multiprocessing.Pool(self.processes, _init_worker,
+            (skin_factory, displayargs, self.shm.name))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.frame = None # Let go of the shared memory before closing it
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def render(self, tiles, lcounter=0, rcounter=0, face=FaceState.Happy):
+        """
+        Renders a frame showing the tile states in tiles.
+        Returns the framebuffer itself as an image, so copy it to keep it past the next render.
+        """
+        display = self.display
+        frame = self.frame
+
+        step = -(-self.rows // self.bands)
+        results = []
+        for first in range(0, self.rows, step):
+            rows = tiles[first:first + step]
+            codes = bytes(state.code for row in rows for state in row)
+            results.append(self.pool.apply_async(_render_band, (first, len(rows), codes)))
+
+        # While the workers draw the board, draw the rest
+        static = display.static_layer()
+        if static is not self._chrome:
+            y1 = display.tiles[0][0].offset[1]
+            y2 = display.tiles[-1][-1].boxcoords[3]
+            width, height = static.size
+            frame.paste(static.crop((0, 0, width, y1)), (0, 0))
+            frame.paste(static.crop((0, y2, width, height)), (0, y2))
+            self._chrome = static
+            self._shown = {}
+
+        display.lcounter.state = lcounter
+        display.rcounter.state = rcounter
+        display.face.state = face
+        for sprite in display.lcounter.digits + [display.face] + display.rcounter.digits:
+            if self._shown.get(sprite) is not sprite.img:
+                img, _, mask = blit(sprite.img, None)
+                if mask is not None:
+                    frame.paste(static.crop(sprite.boxcoords), sprite.offset)
+                frame.paste(img, sprite.offset, mask)
+                self._shown[sprite] = sprite.img
+        display.lcounter.mark_drawn()
+        display.rcounter.mark_drawn()
+
+        for result in results:
+            result.get()
+        return frame
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
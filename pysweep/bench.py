@@ -0,0 +1,223 @@
+"""
+Benchmarks for skin loading, layout and rendering.
+
+Run standalone:
+
+    python -m pysweep.bench --output bench.json
+    python -m pysweep.bench --compare bench.json
+
+Results are written as JSON, one entry per benchmark and board size,
+holding the best and median time per call in seconds.
+--compare reruns the suite and flags every benchmark
+that got slower than the baseline by more than --threshold.
+
+The doctests below run a tiny ladder so the suite is exercised under pytest too.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+from .dirstruct import Multi, Dir, TarDir
+from .display import Display, DisplayImage, Tile, TileState
+from .skin import Skin
+
+
+SIZES = [(9, 9), (16, 16), (16, 30), (50, 50), (100, 100)] # (rows, cols)
+
+def measure(func, number=10, repeat=5):
+    """
+    Calls func number times per repeat, returns per-call times of each repeat.
+
+        >>> len(measure(lambda: None, number=2, repeat=3))
+        3
+    """
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        for n in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+""" Benchmarks """
+
+def skin_sources():
+    return {
+        'dir': lambda: Dir('images'),
+        'tardir': lambda: TarDir('images.tar.gz').images,
+        'multi': lambda: Multi(Dir('images_d_tiles'), Dir('images')),
+    }
+
+def bench_preload(source):
+    skin = Skin(source)
+    def run():
+        skin.cache = {}
+        skin.preload_skin()
+    return run
+
+def bench_sprite_state(skin):
+    tile = Tile(DisplayImage(None), skin.board.tile)
+    states = [TileState.Number[i] for i in range(9)] + [TileState.Flag, TileState.Unopened]
+    def run():
+        for state in states:
+            tile.state = state
+    return run
+
+def new_display(skin, rows, cols):
+    displayimg = DisplayImage(None)
+    display = Display(displayimg, skin, boardrows=rows, boardcols=cols)
+    displayimg.pil_image = Image.new(size=display.size, mode="RGBA")
+    return display
+
+def bench_construct(skin, rows, cols):
+    return lambda: Display(DisplayImage(None), skin, boardrows=rows, boardcols=cols)
+
+def bench_draw(skin, rows, cols):
+    return new_display(skin, rows, cols).draw
+
+def bench_tile(skin, rows, cols):
+    display = new_display(skin, rows, cols)
+    display.draw()
+    tile = display.tiles[rows//2][cols//2]
+    states = [TileState.Number[i] for i in range(9)] + [TileState.Flag, TileState.Unopened]
+    def run():
+        for state in states:
+            tile.state = state
+            tile.draw()
+    return run
+
+def bench_counter(skin, rows, cols):
+    display = new_display(skin, rows, cols)
+    display.draw()
+    counter = display.rcounter
+    def run():
+        for value in range(0, 1000, 7):
+            counter.state = value
+            counter.draw_changed()
+    return run
+
+def bench_expand(skin, rows, cols):
+    display = new_display(skin, rows, cols)
+    width, height = display.size
+    def run():
+        display.expand(width + 64, height + 64)
+        display.expand(width, height)
+    return run
+
+DISPLAY_BENCHMARKS = {
+    'construct': bench_construct,
+    'draw': bench_draw,
+    'tile': bench_tile,
+    'counter': bench_counter,
+    'expand': bench_expand,
+}
+
+def run(sizes=SIZES, number=10, repeat=5, only=None, log=None):
+    """
+    Runs every benchmark, returns {name: {'best': s, 'median': s, ...}}.
+
+        >>> results = run(sizes=[(2, 3)], number=1, repeat=1)
+        >>> sorted(results)
+        ['construct[2x3]', 'counter[2x3]', 'draw[2x3]', 'expand[2x3]', \
+'preload[dir]', 'preload[multi]', 'preload[tardir]', 'sprite_state', 'tile[2x3]']
+        >>> sorted(results['draw[2x3]'])
+        ['best', 'median', 'number', 'repeat']
+    """
+    cases = []
+    for name, source in skin_sources().items():
+        cases.append((f'preload[{name}]', lambda source=source: bench_preload(source())))
+
+    skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+    cases.append(('sprite_state', lambda: bench_sprite_state(skin)))
+    for rows, cols in sizes:
+        for name, bench in DISPLAY_BENCHMARKS.items():
+            cases.append((f'{name}[{rows}x{cols}]',
+                          lambda bench=bench, rows=rows, cols=cols: bench(skin, rows, cols)))
+
+    results = {}
+    for name, make in cases:
+        if only and not any(o in name for o in only):
+            continue
+        skin.cache = {}
+        skin.preload_skin()
+        times = measure(make(), number, repeat)
+        results[name] = {
+            'best': min(times),
+            'median': statistics.median(times),
+            'number': number,
+            'repeat': repeat,
+        }
+        if log:
+            log(f'{name:<24} {min(times)*1000:10.3f}ms')
+    skin.cache = {}
+    return results
+
+def compare(results, baseline, threshold=1.25):
+    """
+    Returns (name, baseline best, current best) for every benchmark
+    that is more than threshold times slower than the baseline.
+
+        >>> compare({'a': {'best': 2.0}, 'b': {'best': 1.0}, 'c': {'best': 1.0}},
+        ...         {'a': {'best': 1.0}, 'b': {'best': 1.0}})
+        [('a', 1.0, 2.0)]
+    """
+    regressions = []
+    for name, result in results.items():
+        try:
+            base = baseline[name]['best']
+        except KeyError:
+            continue
+        if result['best'] > base * threshold:
+            regressions.append((name, base, result['best']))
+    return regressions
+
+def main(argv=None): # pragma: no cover
+    parser = argparse.ArgumentParser(description='PySweeper benchmarks')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help='slowdown ratio counted as a regression (default 1.25)')
+    parser.add_argument('--sizes', nargs='+', metavar='ROWSxCOLS',
+        help='board sizes to run (default: ' + ' '.join(f'{r}x{c}' for r, c in SIZES) + ')')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='only run benchmarks containing NAME')
+    parser.add_argument('--number', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    sizes = SIZES
+    if args.sizes:
+        sizes = [tuple(int(n) for n in s.split('x')) for s in args.sizes]
+
+    results = run(sizes, args.number, args.repeat, args.only,
+        log=lambda line: print(line, file=sys.stderr))
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    else:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, current in regressions:
+            print(f'REGRESSION {name}: {base*1000:.3f}ms -> {current*1000:.3f}ms '
+                  f'({current/base:.2f}x)', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__": # pragma: no cover
+    main()
@@ -1,5 +1,7 @@
 from collections import namedtuple
+import contextlib
 import itertools
+import threading
 
 
 class Thickness:
@@ -89,7 +91,8 @@ class Box:
         self.localoffset_y = 0
         self.parentoffset_x = 0
         self.parentoffset_y = 0
-        self.update_child_offsets()
+        if not layout_deferred():
+            self.update_child_offsets()
 
     @property
     def size(self):
@@ -139,9 +142,92 @@ class Box:
     def update_child_offsets(self):
         pass
 
+    def children(self):
+        """ The boxes directly inside this box, in drawing order """
+        return ()
+
+    def initial_size(self):
+        """ measure, unless the layout is deferred (then it is restored later instead) """
+        if layout_deferred():
+            return (0, 0)
+        return self.measure()
+
+    def measure(self):
+        """
+        The minimum (width, height) of this box given the current sizes of its children,
+        sizing the children to match where this box lays them out that way.
+        """
+        return (self.minwidth, self.minheight)
+
+    def relayout(self):
+        """
+        Recomputes every minimum size from the bottom up,
+        after some boxes inside changed theirs,
+        leaving every box at its minimum size.
+        Offsets are not updated, call update_child_offsets on the outermost box afterwards.
+
+            >>> b1, b2 = Box(1, 1), Box(2, 3)
+            >>> gb = GridBox([[b1, b2]])
+            >>> bb = BorderBox(gb, thickness=Thickness(1, 1, 1, 1))
+            >>> b1.minwidth, b1.minheight = (5, 5)
+            >>> bb.relayout()
+            >>> bb.update_child_offsets()
+            >>> bb.size, gb.size, b1.size, b2.size, b2.offset
+            ((9, 7), (7, 5), (5, 5), (2, 5), (6, 1))
+        """
+        for b in self.children():
+            b.relayout()
+        self.minwidth, self.minheight = self.measure()
+        self.width, self.height = self.minwidth, self.minheight
+
+    def walk(self):
+        """
+        This box followed by every box inside it, in drawing order.
+
+            >>> b1, b2, b3 = Box(1, 1), Box(1, 1), Box(1, 1)
+            >>> lb = LayerBox(GridBox([[b1, b2]]), BorderBox(b3))
+            >>> [type(b).__name__ for b in lb.walk()]
+            ['LayerBox', 'GridBox', 'Box', 'Box', 'BorderBox', 'Box']
+            >>> list(lb.walk())[-1] is b3
+            True
+        """
+        stack = [self]
+        while stack:
+            b = stack.pop()
+            yield b
+            stack.extend(reversed(tuple(b.children())))
+
     def draw(self):
         pass
 
+_layout = threading.local() # deferred is only ever set for the thread inside deferred_layout
+
+def layout_deferred():
+    """ Whether boxes made now (on this thread) skip their layout """
+    return getattr(_layout, 'deferred', False)
+
+@contextlib.contextmanager
+def deferred_layout():
+    """
+    Boxes made inside this skip measuring, sizing and placing their children,
+    for when a saved layout is restored onto them afterwards.
+    Only boxes made on the same thread are affected.
+
+        >>> with deferred_layout():
+        ...     bb = BorderBox(Box(3, 4), thickness=Thickness(1, 1, 1, 1))
+        ...     other = []
+        ...     t = threading.Thread(target=lambda: other.append(BorderBox(Box(3, 4), thickness=Thickness(1, 1, 1, 1))))
+        ...     t.start(); t.join()
+        >>> bb.size, other[0].size, layout_deferred()
+        ((0, 0), (5, 6), False)
+    """
+    old = layout_deferred()
+    _layout.deferred = True
+    try:
+        yield
+    finally:
+        _layout.deferred = old
+
 class GridBox(Box):
     """
     Makes a grid of boxes.
@@ -216,15 +302,18 @@ class GridBox(Box):
         self.colmatch = [(f is not None) for f in colfactors]
         self.rowmatch = [(f is not None) for f in rowfactors]
 
-        self.colwidths = [max(b.minwidth for b in col) for col in self.cols]
-        self.rowheights = [max(b.minheight for b in row) for row in self.rows]
-
         self.cumcolfactors = list(itertools.accumulate(self.colfactors))
         self.cumrowfactors = list(itertools.accumulate(self.rowfactors))
 
         self.sumcolfactors = self.cumcolfactors[-1]
         self.sumrowfactors = self.cumrowfactors[-1]
 
+        Box.__init__(self, *self.initial_size())
+
+    def measure(self):
+        self.colwidths = [max(b.minwidth for b in col) for col in self.cols]
+        self.rowheights = [max(b.minheight for b in row) for row in self.rows]
+
         for colwidth, col, match in zip(self.colwidths, self.cols, self.colmatch):
             if match:
                 for b in col:
@@ -235,7 +324,7 @@ class GridBox(Box):
                 for b in row:
                     b.expand(None, rowheight)
 
-        Box.__init__(self, sum(self.colwidths), sum(self.rowheights))
+        return (sum(self.colwidths), sum(self.rowheights))
 
     @property
     def rows(self):
@@ -296,11 +385,100 @@ class GridBox(Box):
             for b, offset_x in zip(row, cumcolwidths):
                 b.set_parentoffset(self.offset_x + offset_x, self.offset_y + offset_y)
 
+    def children(self):
+        return itertools.chain.from_iterable(self.rows)
+
     def draw(self):
         for row in self.rows:
             for b in row:
                 b.draw()
 
+class UniformGridBox(Box):
+    """
+    A grid of boxes that all have the same fixed size, such as the board's tiles.
+
+    Any cell's offset is just origin + (col*w, row*h),
+    so there are no per-column lists, cumulative sums or per-box expands.
+    The cells never grow, expanding the grid only grows the grid itself.
+
+        >>> cells = [[Box(4, 3) for j in range(5)] for i in range(2)]
+        >>> ugb = UniformGridBox(cells)
+        >>> ugb.size, ugb.cellsize
+        ((20, 6), (4, 3))
+        >>> ugb.set_parentoffset(10, 100)
+        >>> ugb.cell_offset(1, 2), cells[1][2].offset
+        ((18, 103), (18, 103))
+        >>> ugb.cell_at(19, 104), ugb.cell_at(30, 104)
+        ((1, 2), None)
+
+    Lays out the same as a GridBox
+        >>> cells2 = [[Box(4, 3) for j in range(5)] for i in range(2)]
+        >>> gb = GridBox(cells2)
+        >>> gb.set_parentoffset(10, 100)
+        >>> [b.offset for row in cells for b in row] == [b.offset for row in cells2 for b in row]
+        True
+        >>> UniformGridBox([[Box(4, 3), Box(4, 4)]])
+        Traceback (most recent call last):
+          ...
+        ValueError: Every cell of a UniformGridBox must have the same size
+    """
+    def __init__(self, subboxes, expandfactor=1):
+        self.subboxes = subboxes
+        self._origin = None # Offset the cells were last placed from
+        Box.__init__(self, *self.initial_size(), expandfactor)
+
+    @staticmethod
+    def is_uniform(subboxes):
+        size = subboxes[0][0].size
+        return all(b.size == size for row in subboxes for b in row)
+
+    @property
+    def rows(self):
+        return self.subboxes
+
+    def measure(self):
+        if not self.is_uniform(self.subboxes):
+            raise ValueError('Every cell of a UniformGridBox must have the same size')
+        self.cellsize = w, h = self.subboxes[0][0].size
+        return (w * len(self.subboxes[0]), h * len(self.subboxes))
+
+    def relayout(self):
+        Box.relayout(self)
+        self._origin = None
+
+    def cell_offset(self, row, col):
+        w, h = self.cellsize
+        return (self.offset_x + col * w, self.offset_y + row * h)
+
+    def cell_at(self, x, y):
+        """ (row, col) of the cell containing the point x, y, or None """
+        w, h = self.cellsize
+        col, dx = divmod(x - self.offset_x, w)
+        row, dy = divmod(y - self.offset_y, h)
+        if 0 <= row < len(self.subboxes) and 0 <= col < len(self.subboxes[0]):
+            return (row, col)
+        return None
+
+    def update_child_offsets(self):
+        origin = (self.offset_x, self.offset_y)
+        if origin == self._origin:
+            return
+        self._origin = origin
+        x0, y0 = origin
+        w, h = self.cellsize
+        for i, row in enumerate(self.subboxes):
+            y = y0 + i * h
+            for j, b in enumerate(row):
+                b.set_parentoffset(x0 + j * w, y)
+
+    def children(self):
+        return itertools.chain.from_iterable(self.subboxes)
+
+    def draw(self):
+        for row in self.subboxes:
+            for b in row:
+                b.draw()
+
 class LayerBox(Box):
     def __init__(self, *subboxes, matchsizes=True, expandfactor=1):
         """
@@ -322,11 +500,15 @@ class LayerBox(Box):
         self.subboxes = subboxes
         self.matchsizes = matchsizes
 
-        Box.__init__(self, max(b.minwidth for b in subboxes), max(b.minheight for b in subboxes), expandfactor)
+        Box.__init__(self, *self.initial_size(), expandfactor)
 
-        if matchsizes:
-            for b in subboxes:
-                b.expand(self.minwidth, self.minheight)
+    def measure(self):
+        width = max(b.minwidth for b in self.subboxes)
+        height = max(b.minheight for b in self.subboxes)
+        if self.matchsizes:
+            for b in self.subboxes:
+                b.expand(width, height)
+        return (width, height)
 
     def expand(self, width, height):
         if self.matchsizes:
@@ -339,6 +521,9 @@ class LayerBox(Box):
         for b in self.subboxes:
             b.set_parentoffset(self.offset_x, self.offset_y)
 
+    def children(self):
+        return self.subboxes
+
     def draw(self):
         for b in self.subboxes:
             b.draw()
@@ -366,7 +551,10 @@ class BorderBox(Box):
         else:
             self.thickness = thickness = Thickness()
 
-        Box.__init__(self, innerbox.width + thickness.width, innerbox.height + thickness.height, expandfactor)
+        Box.__init__(self, *self.initial_size(), expandfactor)
+
+    def measure(self):
+        return (self.innerbox.width + self.thickness.width, self.innerbox.height + self.thickness.height)
 
     def expand(self, width, height):
         innerwidth = width - self.thickness.width if width is not None else None
@@ -379,6 +567,9 @@ class BorderBox(Box):
     def update_child_offsets(self):
         self.innerbox.set_parentoffset(self.offset_x + self.thickness.l, self.offset_y + self.thickness.t)
 
+    def children(self):
+        return (self.innerbox,)
+
     def draw(self):
         self.innerbox.draw()
 
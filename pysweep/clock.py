@@ -0,0 +1,255 @@
+"""
+Game clock and frame scheduler
+
+Tk's after() only promises to call back some time after the delay,
+so a timer that adds a second per after(1000) drifts, and frames queued under load bunch up.
+
+The GameClock keeps game time on its own from a monotonic high resolution clock,
+so what it says never depends on when anything was drawn.
+The FrameScheduler runs tasks at wall clock deadlines
+that are fixed ahead of time (origin + k * period) rather than counted from the last run,
+so lateness never accumulates. A task that falls behind runs once and skips
+to its next deadline in the future, so late frames are merged, never queued up.
+after() is only used to wake up, with the delay worked out again each time.
+"""
+
+import math
+import time
+
+
+class GameClock:
+    """
+    Game time, which only advances while the game is running.
+
+        >>> t = [100.0]
+        >>> clock = GameClock(clock=lambda: t[0])
+        >>> clock.elapsed(), clock.running
+        (0, False)
+        >>> clock.start()
+        >>> t[0] = 101.234
+        >>> clock.centiseconds()
+        123
+        >>> clock.pause()
+        >>> t[0] = 500
+        >>> clock.centiseconds(), clock.deadline(2)
+        (123, None)
+        >>> clock.resume()
+        >>> round(clock.deadline(2), 3) # When the clock will read 2 seconds
+        500.766
+        >>> t[0] = 501
+        >>> clock.stop()
+        >>> clock.centiseconds()
+        223
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self._origin = None # Wall clock time at which game time would have been 0, while running
+        self._elapsed = 0 # Game time when last paused
+
+    @property
+    def running(self):
+        return self._origin is not None
+
+    def start(self):
+        self.reset()
+        self.resume()
+
+    def resume(self):
+        if self._origin is None:
+            self._origin = self.clock() - self._elapsed
+
+    def pause(self):
+        if self._origin is not None:
+            self._elapsed = self.clock() - self._origin
+            self._origin = None
+
+    stop = pause
+
+    def elapsed(self):
+        """ Game time in seconds """
+        if self._origin is None:
+            return self._elapsed
+        return self.clock() - self._origin
+
+    def centiseconds(self):
+        return int(self.elapsed() * 100)
+
+    def deadline(self, elapsed):
+        """ The wall clock time at which game time reaches elapsed, or None while stopped """
+        if self._origin is None:
+            return None
+        return self._origin + elapsed
+
+""" Tasks """
+
+class Periodic:
+    """
+    Calls callback() every period seconds, at origin + k * period.
+    A late run still moves on to the next deadline after now,
+    and counts the runs it skipped as dropped.
+
+    Waking exactly on each deadline runs every frame once
+        >>> ran = []
+        >>> task = Periodic(1/60, lambda: ran.append(1), origin=0.1)
+        >>> for i in range(2000):
+        ...     task.run(task.deadline())
+        >>> len(ran), task.frame, task.dropped
+        (2000, 2001, 0)
+    """
+    def __init__(self, period, callback, origin):
+        self.period = period
+        self.callback = callback
+        self.origin = origin
+        self.frame = 1 # Index k of the next deadline
+        self.runs = 0
+        self.dropped = 0
+
+    def deadline(self):
+        return self.origin + self.frame * self.period
+
+    def run(self, now):
+        self.callback()
+        self.runs += 1
+        # Rounding can put now just before the deadline it woke for, so never go back to it
+        k = max(math.floor((now - self.origin) / self.period) + 1, self.frame + 1)
+        self.dropped += k - self.frame - 1
+        self.frame = k
+
+class CounterTick:
+    """
+    Keeps a Counter showing the whole seconds of a GameClock.
+    It is due exactly when the shown second changes,
+    and sets the counter from the clock itself, so it is never off by missed ticks.
+    Counters only have whole seconds to show, so this only ticks once a second;
+    the finer time (GameClock.centiseconds) is always read from the clock itself.
+    """
+    def __init__(self, counter, gameclock):
+        self.counter = counter
+        self.gameclock = gameclock
+        self.shown = None # Second last put on the counter
+        self.runs = 0
+
+    def deadline(self):
+        clock = self.gameclock
+        if not clock.running:
+            return None
+        if int(clock.elapsed()) != self.shown:
+            return clock.clock() # Behind (or the clock was reset), due now
+        return clock.deadline(self.shown + 1)
+
+    def run(self, now):
+        # Woken at the deadline for the next second, the clock can read a hair before it
+        self.shown = int(self.gameclock.elapsed() + 1e-9)
+        self.counter.state = self.shown
+        self.runs += 1
+
+class FrameScheduler:
+    """
+    Runs tasks at their deadlines.
+    Tasks run in the order they were added, so add the ones that change state
+    (like counter ticks) before the one that flushes the frame.
+
+        >>> from .display import Display, DisplayImage
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> display = Display(DisplayImage(None), Skin(Multi(Dir('images_d_tiles'), Dir('images'))))
+
+        >>> t = [0.0]
+        >>> gameclock = GameClock(clock=lambda: t[0])
+        >>> scheduler = FrameScheduler(clock=lambda: t[0])
+        >>> timer = scheduler.tick_counter(display.rcounter, gameclock)
+        >>> flushes = []
+        >>> frames = scheduler.every(1/60, lambda: flushes.append(display.rcounter.state))
+        >>> gameclock.start()
+
+    On time, one frame per deadline
+        >>> for i in range(1, 61):
+        ...     t[0] = i / 60
+        ...     _ = scheduler.run_due()
+        >>> len(flushes), frames.dropped, display.rcounter.state
+        (60, 0, 1)
+
+    Rendering falls behind by 2.37 seconds: one merged frame, and the timer is still right
+        >>> t[0] = 3.37
+        >>> scheduler.run_due()
+        2
+        >>> len(flushes), frames.dropped, display.rcounter.state, flushes[-1]
+        (61, 141, 3, 3)
+        >>> gameclock.centiseconds()
+        337
+
+    The delay for after() is to the next deadline on the fixed grid, with no drift
+        >>> scheduler.delay()
+        14
+        >>> frames.frame
+        203
+
+    Stopping the clock freezes the counter and stops its ticks
+        >>> gameclock.stop()
+        >>> t[0] = 10
+        >>> _ = scheduler.run_due()
+        >>> display.rcounter.state, timer.deadline()
+        (3, None)
+        >>> display.skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.tasks = []
+        self._after_id = None
+
+    def add(self, task):
+        self.tasks.append(task)
+        return task
+
+    def remove(self, task):
+        self.tasks.remove(task)
+
+    def every(self, period, callback):
+        return self.add(Periodic(period, callback, self.clock()))
+
+    def tick_counter(self, counter, gameclock):
+        return self.add(CounterTick(counter, gameclock))
+
+    def next_deadline(self):
+        deadlines = [d for d in (task.deadline() for task in self.tasks) if d is not None]
+        return min(deadlines, default=None)
+
+    def run_due(self, now=None):
+        """ Runs every task whose deadline has passed, once. Returns how many ran """
+        if now is None:
+            now = self.clock()
+        ran = 0
+        for task in list(self.tasks):
+            deadline = task.deadline()
+            if deadline is not None and deadline <= now:
+                task.run(now)
+                ran += 1
+        return ran
+
+    def delay(self, now=None, idle=100):
+        """ Whole milliseconds until the next deadline (idle if there is none), for after() """
+        deadline = self.next_deadline()
+        if deadline is None:
+            return idle
+        if now is None:
+            now = self.clock()
+        return max(0, math.ceil((deadline - now) * 1000))
+
+    def schedule(self, widget): # pragma: no cover
+        """ Keeps running the tasks with widget.after, waking up at each deadline """
+        def wake():
+            self.run_due()
+            self._after_id = widget.after(self.delay(), wake)
+        self._after_id = widget.after(self.delay(), wake)
+
+    def unschedule(self, widget): # pragma: no cover
+        if self._after_id is not None:
+            widget.after_cancel(self._after_id)
+            self._after_id = None
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -1,5 +1,9 @@
 from enum import Enum, auto
-from .box import Thickness, Box, GridBox, LayerBox, BorderBox
+
+from PIL import Image
+
+from .box import Thickness, Box, GridBox, UniformGridBox, LayerBox, BorderBox
+from .skin import OPAQUE, alpha_info
 
 """ Errors """
 
@@ -9,21 +13,25 @@ class NotExpandableError(Exception):
 """ State Enums """
 
 class DigitState:
-    class Off: name = 'off.png'
-    class Minus: name = '-.png'
+    class Off: name = 'off.png'; code = 0
+    class Minus: name = '-.png'; code = 1
     # A bit of magic to create 10 classes of 'Digit' in an array
     # You use this like DigitState.Digit[i] where i=0..9
     Digit = [type('Digit_{}'.format(i),
                    (),
-                   {'n': i, 'name': f'{i}.png'})
+                   {'n': i, 'name': f'{i}.png', 'code': 2+i})
               for i in range(10)]
+    # Every state, indexed by its code
+    STATES = [Off, Minus] + Digit
 
 class FaceState:
-    class Happy: name = 'happy.png'
-    class Pressed: name = 'pressed.png'
-    class Blast: name = 'blast.png'
-    class Cool: name = 'cool.png'
-    class Nervous: name = 'nervous.png'
+    class Happy: name = 'happy.png'; code = 0
+    class Pressed: name = 'pressed.png'; code = 1
+    class Blast: name = 'blast.png'; code = 2
+    class Cool: name = 'cool.png'; code = 3
+    class Nervous: name = 'nervous.png'; code = 4
+    # Every state, indexed by its code
+    STATES = [Happy, Pressed, Blast, Cool, Nervous]
 
 class TileState:
     """
@@ -31,18 +39,28 @@ class TileState:
 
     Seems easier to use than an actual Enum
     because of the Number[0] syntax.
+
+    Every state also has a small integer code,
+    so that sprites can find their image with a list index.
+
+        >>> all(state.code == i for i, state in enumerate(TileState.STATES))
+        True
+        >>> TileState.Number[3].code
+        8
     """
-    class Mine: name = 'mine.png'
-    class Blast: name = 'blast.png'
-    class Flag: name = 'flag.png'
-    class FlagWrong: name = 'flagwrong.png'
-    class Unopened: name = 'unopened.png'
+    class Mine: name = 'mine.png'; code = 0
+    class Blast: name = 'blast.png'; code = 1
+    class Flag: name = 'flag.png'; code = 2
+    class FlagWrong: name = 'flag_wrong.png'; code = 3
+    class Unopened: name = 'unopened.png'; code = 4
     # A bit of magic to create 9 classes of 'Number' in an array
     # You use this like TileState.Number[i] where i=0..8
     Number = [type('Number_{}'.format(i),
                    (),
-                   {'n': i, 'name': f'{i}.png'})
+                   {'n': i, 'name': f'{i}.png', 'code': 5+i})
               for i in range(9)]
+    # Every state, indexed by its code
+    STATES = [Mine, Blast, Flag, FlagWrong, Unopened] + Number
 
 """ DisplayImage """
 
@@ -50,16 +68,59 @@ class DisplayImage:
     """
     Image objects are passed into these parts as the first arg,
     and they call .paste to paste images into this 'image'.
+
+    Repainted boxes are remembered until take_dirty.
+    Past MAX_DIRTY of them they are collapsed into one box covering the whole image,
+    so nothing grows when no one takes them.
+
+        >>> from PIL import Image
+        >>> image = DisplayImage(Image.new(size=(20, 10), mode="RGBA"))
+        >>> for i in range(DisplayImage.MAX_DIRTY + 100):
+        ...     image.invalidate((0, 0, 1, 1))
+        >>> image.dirty
+        [(0, 0, 20, 10)]
+        >>> image.take_dirty(), image.dirty
+        ([(0, 0, 20, 10)], [])
     """
+    MAX_DIRTY = 512
+
     def __init__(self, pil_image):
         self.pil_image = pil_image
+        self.dirty = [] # Boxes (x1, y1, x2, y2) repainted since the last take_dirty
+        self._whole = False # Whether dirty has been collapsed to the whole image
 
     def paste(self, img, coords):
-        self.pil_image.paste(img, coords, img)
+        kind, mask = alpha_info(img)
+        if kind is OPAQUE:
+            self.pil_image.paste(img, coords)
+        else:
+            self.pil_image.paste(img, coords, mask)
 
     def paste_pixel(self, pixel, coords):
         self.pil_image.paste(pixel, coords)
 
+    def invalidate(self, coords):
+        if self._whole:
+            return
+        if len(self.dirty) < self.MAX_DIRTY:
+            self.dirty.append(coords)
+        else:
+            self.dirty = [(0, 0) + self.pil_image.size]
+            self._whole = True
+
+    def take_dirty(self):
+        """ Returns and forgets the boxes invalidated so far """
+        dirty, self.dirty = self.dirty, []
+        self._whole = False
+        return dirty
+
+_plain_paste = DisplayImage.paste # Display.draw pastes into the PIL image itself when paste is this
+
+def blit(img, coords):
+    """ A display list entry: (img, coords, mask), the mask None when img is opaque """
+    kind, mask = alpha_info(img)
+    return (img, coords, None if kind is OPAQUE else mask)
+
 """ Drawing classes """
 
 class GridTile(Box):
@@ -77,15 +138,20 @@ class GridTile(Box):
     def __init__(self, image, skin, pastetype=None, expandfactor=1):
         self.image, self.skin = image, skin
 
-        Type = GridTile.PasteType
-
         if pastetype is None:
-            pastetype = Type.Tile
+            pastetype = GridTile.PasteType.Tile
+        self.requested_pastetype = pastetype
 
         self.tileimg = skin.open()
 
         Box.__init__(self, *self.tileimg.size, expandfactor=expandfactor)
 
+        self.prepare()
+
+    def prepare(self):
+        Type = GridTile.PasteType
+        pastetype = self.requested_pastetype
+
         # Detect optimisations
         if pastetype == Type.Tile and self.tileimg.size == (1, 1):
             pastetype = Type.TileFast
@@ -104,6 +170,17 @@ class GridTile(Box):
         elif pastetype == Type.VertFast:
             self.tileimg = self.tileimg.resize((self.tileimg.size[0], self.height))
 
+    def retarget(self, skin):
+        """ Switches to the same image of another skin """
+        self.skin = skin
+        self.tileimg = skin.open()
+        self.minwidth, self.minheight = self.tileimg.size
+        self.prepare()
+
+    def relayout(self):
+        Box.relayout(self)
+        self.expand(self.width, self.height) # Resizes the stretched images
+
     def expand(self, width, height):
         Type = GridTile.PasteType
 
@@ -135,23 +212,72 @@ class GridTile(Box):
             raise ValueError('Invalid pastetype')
 
 class Sprite(Box):
+    """
+    A fixed size image showing one of the states in STATES.
+
+    The images for every state are loaded into a table once per skin,
+    so changing state is just a list index by the state's code.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Dir
+        >>> skin = Skin(Dir('images'))
+        >>> tile = Tile(DisplayImage(None), skin.board.tile)
+        >>> tile.state = TileState.Number[2]
+        >>> tile.img is skin.board.tile['2.png'].open()
+        True
+        >>> Tile(DisplayImage(None), skin.board.tile).table is tile.table
+        True
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
     # INITIAL_VALUE = FaceState.Happy # Something like this
+    # STATES = FaceState
+    _tables = {} # Map of (STATES, source, path, zoom, generation) to a list of images indexed by code
+    _slot = None # (display list, index) of this sprite's entry, see Display.display_list
+
     def __init__(self, image, skin, init_val=None):
         self.image, self.skin = image, skin
 
+        self.table = self.load_table(skin)
+
         if init_val is None:
             init_val = self.INITIAL_VALUE
         self.state = init_val # sets self.img, see @state.setter below
 
         Box.__init__(self, *self.img.size, expandfactor=0)
 
+    def retarget(self, skin):
+        """ Switches to the images of another skin, keeping the state """
+        self.skin = skin
+        self.table = self.load_table(skin)
+        self.img = self.table[self._state.code]
+        self.minwidth, self.minheight = self.img.size
+
+    @classmethod
+    def load_table(cls, skin):
+        key = (cls.STATES, skin._source, skin._path, skin.zoom, skin.generation)
+        try:
+            return Sprite._tables[key]
+        except KeyError:
+            table = Sprite._tables[key] = [skin[state.name].open() for state in cls.STATES.STATES]
+            return table
+
     @property
     def state(self):
         return self._state
     @state.setter
     def state(self, state):
         self._state = state
-        self.img = self.skin[state.name].open()
+        self.img = self.table[state.code]
+
+    @property
+    def img(self):
+        return self._img
+    @img.setter
+    def img(self, img):
+        self._img = img
+        if self._slot is not None:
+            ops, i = self._slot
+            ops[i] = blit(img, ops[i][1])
 
     def expand(self, width, height):
         if ((width is not None and self.minwidth != width) or
@@ -160,17 +286,21 @@ class Sprite(Box):
 
     def draw(self):
         self.image.paste(self.img, self.offset)
+        self.image.invalidate(self.boxcoords)
 
 """ Drawing parts """
 
 class Digit(Sprite):
     INITIAL_VALUE = DigitState.Off
+    STATES = DigitState
 
 class Face(Sprite):
     INITIAL_VALUE = FaceState.Happy
+    STATES = FaceState
 
 class Tile(Sprite):
     INITIAL_VALUE = TileState.Unopened
+    STATES = TileState
 
 class BorderCorner(GridTile):
     """ Wrapper around Box that draws a corner of a border. """
@@ -183,6 +313,10 @@ class BorderCorner(GridTile):
             pastetype=GridTile.PasteType.Once,
             expandfactor=0)
 
+    def retarget(self, skin):
+        GridTile.retarget(self, skin)
+        self.borderimg = self.tileimg
+
     def expand(self, width, height):
         if ((width is not None and self.minwidth != width) or
             (height is not None and self.minheight != height)):
@@ -241,12 +375,55 @@ class Border(GridBox):
 
         GridBox.__init__(self, [[tl, t, tr], [l, m, r], [bl, b, br]], colfactors=(0, 1, 0), rowfactors=(0, 1, 0))
 
+    def retarget(self, skin):
+        """ Takes the thickness of the edges, once they are retargeted """
+        self.skin = skin
+        # Updated in place, as BorderBoxes share this Thickness
+        self.thickness.b = self.b.minheight
+        self.thickness.l = self.l.minwidth
+        self.thickness.r = self.r.minwidth
+        self.thickness.t = self.t.minheight
+
 """ Parts """
 
 class Counter(LayerBox):
     """
     A counter used for the mine counter and the timer
+
+    Setting state only touches the digits whose character changed,
+    and draw_changed repaints just those digits.
+
+        >>> from PIL import Image
+        >>> from .skin import Skin
+        >>> from .dirstruct import Dir
+
+        >>> skin = Skin(Dir('images'))
+        >>> displayimg = DisplayImage(None)
+        >>> counter = Counter(displayimg, skin.panel.lcounter, numdigits=3)
+        >>> displayimg.pil_image = Image.new(size=counter.size, mode="RGBA")
+        >>> counter.draw()
+        >>> [d.state.name for d in counter.digits]
+        ['off.png', 'off.png', '0.png']
+
+        >>> counter.state = 109
+        >>> counter.draw_changed()
+        [0, 1, 2]
+        >>> _ = displayimg.take_dirty()
+        >>> counter.state = 108
+        >>> counter.draw_changed()
+        [2]
+        >>> displayimg.take_dirty() == [counter.digits[2].boxcoords]
+        True
+        >>> counter.state = 108
+        >>> counter.draw_changed()
+        []
+        >>> counter.state = -5
+        >>> [d.state.name for d in counter.digits]
+        ['off.png', '-.png', '5.png']
+        >>> skin.cache = {} # Clean up for the sake of other tests
     """
+    _digittables = {} # Map of (source, path, zoom, generation) of a digit skin to {character: (state, image)}
+
     def __init__(self, image, skin, border=None,
         init_val=0, numdigits=None):
         self.image, self.skin = image, skin
@@ -258,7 +435,11 @@ class Counter(LayerBox):
         self.border = border
 
         self.digits = digits = [Digit(image, skin.digit) for i in range(numdigits)]
+        self.digittable = self.load_digittable(skin.digit)
 
+        # Digits start off, so they already show an empty counter
+        self._text = ' ' * numdigits
+        self._changed = set()
         self.state = init_val
 
         LayerBox.__init__(self,
@@ -278,13 +459,48 @@ class Counter(LayerBox):
         self._state = value
         countertext = f'{value:>{self.numdigits}}'
 
-        for i, v in enumerate(countertext):
-            if v == ' ':
-                self.digits[i].state = DigitState.Off
-            elif v == '-':
-                self.digits[i].state = DigitState.Minus
-            else:
-                self.digits[i].state = DigitState.Digit[int(v)]
+        if countertext == self._text:
+            return
+
+        for i, (v, old) in enumerate(zip(countertext, self._text)):
+            if v != old:
+                digit = self.digits[i]
+                digit._state, digit.img = self.digittable[v]
+                self._changed.add(i)
+        self._text = countertext
+
+    @classmethod
+    def load_digittable(cls, skin):
+        key = (skin._source, skin._path, skin.zoom, skin.generation)
+        try:
+            return cls._digittables[key]
+        except KeyError:
+            images = Digit.load_table(skin)
+            states = {' ': DigitState.Off, '-': DigitState.Minus}
+            states.update((str(i), DigitState.Digit[i]) for i in range(10))
+            table = cls._digittables[key] = {
+                v: (state, images[state.code]) for v, state in states.items()}
+            return table
+
+    def retarget(self, skin):
+        self.skin = skin
+        self.digittable = self.load_digittable(skin.digit)
+
+    def draw_changed(self):
+        """ Repaints the digits changed since the last draw, returns their indices """
+        changed = sorted(self._changed)
+        for i in changed:
+            self.digits[i].draw()
+        self._changed.clear()
+        return changed
+
+    def mark_drawn(self):
+        """ Forgets the changed digits, after something else drew all of them """
+        self._changed.clear()
+
+    def draw(self):
+        LayerBox.draw(self)
+        self._changed.clear()
 
 class Panel(LayerBox):
     """
@@ -337,11 +553,16 @@ class Board(LayerBox):
         self.bg = bg
         self.border = border
 
-        self.tiles = [  [ Tile(image, skin.tile)
+        tileskin = skin.tile # Looked up once, every tile shares it
+        self.tiles = [  [ Tile(image, tileskin)
                             for j in range(boardcols)]
                         for i in range(boardrows)]
 
-        tilesbox = GridBox(self.tiles)
+        if UniformGridBox.is_uniform(self.tiles):
+            tilesbox = UniformGridBox(self.tiles)
+        else:
+            tilesbox = GridBox(self.tiles)
+        self.tilesbox = tilesbox
         centered_tiles = GridBox([[Box(0, 0), tilesbox, Box(0, 0)]], colfactors=(1, 0, 1))
 
         mainboard = BorderBox(centered_tiles, thickness=border.thickness)
@@ -365,11 +586,86 @@ class Display(LayerBox):
         >>> img = Image.new(size=display.size, mode="RGBA")
         >>> displayimg.pil_image = img
         >>> display.draw()
+
+    Zoom works from skin images resampled once per zoom level,
+    so drawing costs the same as at native size.
+        >>> zoomed = Display(displayimg, skin, zoom=2)
+        >>> zoomed.size == (display.size[0]*2, display.size[1]*2)
+        True
+        >>> zoomed.tiles[0][0].size
+        (64, 64)
+
+    The static chrome and the sprites can be drawn separately,
+    which gives the same picture as drawing everything.
+        >>> display.draw_static()
+        >>> for sprite in display.sprites():
+        ...     sprite.draw()
+        >>> img2 = Image.new(size=display.size, mode="RGBA")
+        >>> displayimg.pil_image = img2
+        >>> display.draw()
+        >>> img.tobytes() == img2.tobytes()
+        True
+        >>> len(display.sprites()) == 30*16 + 3 + 1 + 3
+        True
+
+    Full draws reuse the static layer until the layout size changes
+        >>> base = display.static_layer()
+        >>> display.draw()
+        >>> display.static_layer() is base
+        True
+
+    They run a compiled display list, in which a sprite patches just its own entry
+        >>> ops = display.display_list()
+        >>> len(ops) == 1 + len(display.sprites())
+        True
+        >>> tile = display.tiles[0][0]
+        >>> tile.state = TileState.Flag
+        >>> display.display_list() is ops, ops[tile._slot[1]][0] is tile.img
+        (True, True)
+        >>> tile.state = TileState.Unopened
+        >>> display.expand(display.size[0] + 10, None)
+        >>> display.display_list() is ops
+        False
+        >>> display.static_layer() is base
+        False
+        >>> img3 = Image.new(size=display.size, mode="RGBA")
+        >>> displayimg.pil_image = img3
+        >>> display.draw()
+        >>> img4 = Image.new(size=display.size, mode="RGBA")
+        >>> displayimg.pil_image = img4
+        >>> LayerBox.draw(display) # Every box drawn directly
+        >>> img3.tobytes() == img4.tobytes()
+        True
+
+    Switching skins retargets the same parts, relaying out when sizes change
+        >>> small = Skin(Dir('images'))
+        >>> display.tiles[3][4].state = TileState.Flag
+        >>> tile = display.tiles[3][4]
+        >>> display.set_skin(small)
+        True
+        >>> display.tiles[3][4] is tile, tile.size
+        (True, (16, 16))
+        >>> fresh = Display(DisplayImage(None), small)
+        >>> fresh.tiles[3][4].state = TileState.Flag
+        >>> display.size == fresh.size
+        True
+        >>> for d in (display, fresh):
+        ...     d.image.pil_image = Image.new(size=d.size, mode="RGBA")
+        ...     d.draw()
+        >>> display.image.pil_image.tobytes() == fresh.image.pil_image.tobytes()
+        True
+        >>> display.set_skin(skin)
+        True
+        >>> display.set_skin(Skin(Multi(Dir(skindir), Dir('images'))))
+        False
         >>> skin.cache = {} # Clean up for the sake of other tests
     """
 
     def __init__(self, image, skin, border=None, panel=None, board=None,
-        lcountersize=3, rcountersize=3, boardcols=30, boardrows=16):
+        lcountersize=3, rcountersize=3, boardcols=30, boardrows=16, zoom=None):
+        if zoom is not None:
+            skin = skin.zoomed(zoom)
+        self.zoom = skin.zoom
         self.image, self.skin = image, skin
 
         if border is None:
@@ -393,3 +689,193 @@ class Display(LayerBox):
             thickness=border.thickness)
 
         LayerBox.__init__(self, panelboard, border)
+
+        self._sprites = None
+        self._staticboxes = None
+        self._static = None # (key, image) of the static layer, see static_layer
+        self._hitindex = None # (key, index) of the spatial index, see hittest
+        self._displaylist = None # (key, ops) of the compiled display list, see display_list
+
+    def sprites(self):
+        """ Every Sprite in the display, in drawing order """
+        if self._sprites is None:
+            self._sprites = [b for b in self.walk() if isinstance(b, Sprite)]
+        return self._sprites
+
+    def static_boxes(self):
+        """ Every box that draws something other than a Sprite, in drawing order """
+        if self._staticboxes is None:
+            self._staticboxes = [b for b in self.walk()
+                if not isinstance(b, Sprite) and type(b).draw is not Box.draw
+                and next(iter(b.children()), None) is None]
+        return self._staticboxes
+
+    def draw_static(self, image=None):
+        """
+        Draws everything except the sprites, onto image if given.
+
+        Sprites never overlap the chrome around them,
+        so this followed by drawing every sprite is the same as drawing everything.
+        """
+        for b in self.static_boxes():
+            if image is None:
+                b.draw()
+            else:
+                old, b.image = b.image, image
+                try:
+                    b.draw()
+                finally:
+                    b.image = old
+
+    def static_layer(self):
+        """
+        The static chrome on its own, composited once per layout size and skin.
+        """
+        key = (self.size, self.skin._source, self.skin._path, self.zoom)
+        if self._static is None or self._static[0] != key:
+            base = Image.new(size=self.size, mode="RGBA")
+            self.draw_static(DisplayImage(base))
+            self._static = (key, base)
+        return self._static[1]
+
+    def set_skin(self, skin, zoom=None):
+        """
+        Switches every part of the display to skin (at zoom, or the current zoom),
+        without rebuilding any of them.
+        The layout is only redone if some image changed size.
+        Returns whether the size of the display changed.
+        """
+        if zoom is None:
+            zoom = self.zoom
+        if skin.zoom != zoom:
+            skin = skin.zoomed(zoom)
+        root = self.skin._path
+
+        resized = False
+        # Children before their parents, Borders need their edges done first
+        for box in reversed(list(self.walk())):
+            if box is self or not hasattr(box, 'skin'):
+                continue
+            newskin = skin.get(box.skin._path.relative_to(root))
+            if hasattr(box, 'retarget'):
+                size = (box.minwidth, box.minheight)
+                box.retarget(newskin)
+                resized |= size != (box.minwidth, box.minheight)
+            else:
+                box.skin = newskin
+        self.skin = skin
+        self.zoom = zoom
+
+        if not resized:
+            return False
+        oldsize = self.size
+        self.relayout()
+        self.update_child_offsets()
+        return self.size != oldsize
+
+    """ Hit testing """
+
+    HIT_BUCKET = 32 # Size in pixels of the cells of the spatial index
+
+    def hit_parts(self):
+        """ (name, box) of the parts hittest reports, most specific first """
+        return [('face', self.face), ('lcounter', self.lcounter), ('rcounter', self.rcounter),
+                ('panel', self.panel), ('board', self.board), ('border', self.border)]
+
+    def _build_hitindex(self):
+        """ Map of (x, y) // HIT_BUCKET to the (coords, target) overlapping that cell """
+        bucket = self.HIT_BUCKET
+        index = {}
+        entries = [(box.boxcoords, (name,)) for name, box in self.hit_parts()]
+        if not isinstance(self.board.tilesbox, UniformGridBox):
+            entries[:0] = [(tile.boxcoords, ('tile', i, j))
+                for i, row in enumerate(self.tiles) for j, tile in enumerate(row)]
+        for coords, target in entries:
+            x1, y1, x2, y2 = coords
+            for bx in range(x1 // bucket, (x2 - 1) // bucket + 1):
+                for by in range(y1 // bucket, (y2 - 1) // bucket + 1):
+                    index.setdefault((bx, by), []).append((coords, target))
+        return index
+
+    def hittest(self, x, y):
+        """
+        What is under the pixel x, y of the display:
+        ('tile', row, col) or (name,) of one of hit_parts, or None.
+
+        Tiles are found arithmetically, everything else through a spatial index
+        that is only rebuilt when the layout changes.
+
+            >>> from .skin import Skin
+            >>> from .dirstruct import Multi, Dir
+            >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+            >>> display = Display(DisplayImage(None), skin, boardcols=8, boardrows=8)
+            >>> x, y = display.tiles[3][5].offset
+            >>> display.hittest(x, y), display.hittest(x+31, y+31), display.hittest(x+32, y)
+            (('tile', 3, 5), ('tile', 3, 5), ('tile', 3, 6))
+            >>> display.hittest(*display.face.offset), display.hittest(*display.rcounter.offset)
+            (('face',), ('rcounter',))
+            >>> display.hittest(0, 0), display.hittest(*display.size)
+            (('border',), None)
+
+        Every pixel agrees with a walk over the boxes
+            >>> def slow(x, y):
+            ...     for i, row in enumerate(display.tiles):
+            ...         for j, tile in enumerate(row):
+            ...             x1, y1, x2, y2 = tile.boxcoords
+            ...             if x1 <= x < x2 and y1 <= y < y2:
+            ...                 return ('tile', i, j)
+            ...     for name, box in display.hit_parts():
+            ...         x1, y1, x2, y2 = box.boxcoords
+            ...         if x1 <= x < x2 and y1 <= y < y2:
+            ...             return (name,)
+            >>> all(display.hittest(x, y) == slow(x, y)
+            ...     for x in range(0, display.size[0], 3) for y in range(0, display.size[1], 3))
+            True
+            >>> skin.cache = {} # Clean up for the sake of other tests
+        """
+        tilesbox = self.board.tilesbox
+        if isinstance(tilesbox, UniformGridBox):
+            cell = tilesbox.cell_at(x, y)
+            if cell is not None:
+                return ('tile',) + cell
+
+        key = (self.size, tilesbox.boxcoords)
+        if self._hitindex is None or self._hitindex[0] != key:
+            self._hitindex = (key, self._build_hitindex())
+        bucket = self.HIT_BUCKET
+        for (x1, y1, x2, y2), target in self._hitindex[1].get((x // bucket, y // bucket), ()):
+            if x1 <= x < x2 and y1 <= y < y2:
+                return target
+        return None
+
+    def display_list(self):
+        """
+        The display compiled into a flat list of blit entries (image, (x, y), mask):
+        the static layer, then every sprite.
+        Sprites patch their own entry when their image changes,
+        so only a new layout or skin compiles it again.
+        """
+        base = self.static_layer()
+        key = (self.size, self.board.tilesbox.boxcoords, self.face.boxcoords, id(base))
+        if self._displaylist is None or self._displaylist[0] != key:
+            ops = [blit(base, self.offset)]
+            for sprite in self.sprites():
+                sprite._slot = (ops, len(ops))
+                ops.append(blit(sprite.img, sprite.offset))
+            self._displaylist = (key, ops)
+        return self._displaylist[1]
+
+    def draw(self):
+        image = self.image
+        if type(image).paste is _plain_paste:
+            paste = image.pil_image.paste
+            for img, coords, mask in self.display_list():
+                paste(img, coords, mask)
+        else:
+            # paste is overridden (or wrapped by a RenderProfile), so go through each part
+            image.paste(self.static_layer(), self.offset)
+            for sprite in self.sprites():
+                sprite.draw()
+        image.invalidate(self.boxcoords)
+        self.lcounter.mark_drawn()
+        self.rcounter.mark_drawn()
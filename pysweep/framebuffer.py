@@ -0,0 +1,336 @@
+"""
+Memory-mapped framebuffer export
+
+A FrameBuffer is a file (or shared memory segment) other processes can map
+to read the display's pixels without screen capture or any encoding.
+
+Layout, all little endian:
+
+    offset  size
+    0       4        magic b'PSFB'
+    4       2        version (2)
+    6       2        maximum number of dirty rectangles, n
+    8       4        width
+    12      4        height
+    16      4        generation, one more each time the file is replaced
+    20      4        (padding)
+    24      8        frame counter, odd while a frame is being written
+    32      4        number of dirty rectangles in the last frame
+    36      4        replaced, 1 once a new file has been put in place of this one
+    40      16*n     dirty rectangles as x1, y1, x2, y2 (4 bytes each)
+    40+16n  4*w*h    RGBA pixels, row by row
+
+The writer makes the frame counter odd, writes the pixels and then the rectangles,
+and makes it even again, so both are covered by it.
+Readers check the frame counter before and after reading (the pixels too, see snapshot),
+and read again if it changed or is odd (a seqlock),
+giving up after a timeout in case the writer died halfway through a frame.
+
+When the display changes size the file is not resized in place,
+which would pull the pages out from under readers that have it mapped.
+A new file is written alongside and renamed over it,
+and the old one marked replaced so that its readers map the new one.
+
+The display is drawn into its own PIL image and the dirty rectangles copied across,
+rather than drawn into the mapping itself:
+readers would see frames half drawn, and PIL keeps images made on a buffer read only.
+When a frame repaints more than n rectangles,
+a single rectangle covering the whole display is listed instead.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from .display import DisplayImage
+
+
+MAGIC = b'PSFB'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIII4x')
+FRAME = struct.Struct('<QII')
+RECT = struct.Struct('<IIII')
+FRAME_OFFSET = HEADER.size
+RECTS_OFFSET = HEADER.size + FRAME.size
+
+def framebuffer_size(size, maxrects=64):
+    """ Bytes needed for a framebuffer of size (width, height) """
+    width, height = size
+    return RECTS_OFFSET + RECT.size * maxrects + width * height * 4
+
+class FrameBuffer:
+    """
+    The writing end of a framebuffer.
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'frame')
+        >>> fb = FrameBuffer.create_file(path, (4, 3), maxrects=2)
+        >>> img = Image.new('RGBA', (4, 3), (1, 2, 3, 255))
+        >>> fb.write(img, [(0, 0, 4, 3)])
+
+        >>> reader = FrameReader.open_file(path)
+        >>> reader.size, reader.frame
+        ((4, 3), 2)
+        >>> frame, rects = reader.read()
+        >>> frame, rects
+        (2, [(0, 0, 4, 3)])
+        >>> reader.image().getpixel((3, 2))
+        (1, 2, 3, 255)
+
+    Only the dirty rectangles are copied in
+        >>> img.paste((9, 9, 9, 255), (1, 1, 3, 2))
+        >>> img.putpixel((0, 0), (7, 7, 7, 255))
+        >>> fb.write(img, [(1, 1, 3, 2)])
+        >>> reader.read()
+        (4, [(1, 1, 3, 2)])
+        >>> reader.image().getpixel((1, 1)), reader.image().getpixel((0, 0))
+        ((9, 9, 9, 255), (1, 2, 3, 255))
+
+    Too many rectangles are listed as the whole display
+        >>> fb.write(img, [(0, 0, 1, 1), (1, 1, 2, 2), (2, 2, 3, 3)])
+        >>> reader.read()
+        (6, [(0, 0, 4, 3)])
+        >>> reader.image().getpixel((0, 0))
+        (7, 7, 7, 255)
+
+    A copy of the pixels checked against the frame counter
+        >>> frame, rects, snap = reader.snapshot()
+        >>> frame, snap.getpixel((1, 1))
+        (6, (9, 9, 9, 255))
+
+    Resizing puts a new file in place of the one readers have mapped, and marks the old one replaced.
+    Readers then map the new one, and list the whole display as dirty
+        >>> fb = fb.resize((5, 2))
+        >>> reader.replaced
+        True
+        >>> fb.write(Image.new('RGBA', (5, 2), (4, 4, 4, 255)), [(0, 0, 1, 1)])
+        >>> reader.read()
+        (2, [(0, 0, 5, 2)])
+        >>> reader.size, reader.generation, reader.replaced
+        ((5, 2), 1, False)
+        >>> reader.image().getpixel((0, 0))
+        (4, 4, 4, 255)
+        >>> sorted(os.listdir(os.path.dirname(path)))
+        ['frame']
+
+    A writer that died halfway through a frame leaves it odd, and readers give up
+        >>> FRAME.pack_into(fb.buf, FRAME_OFFSET, 7, 0, 0)
+        >>> reader.read(timeout=0.01)
+        Traceback (most recent call last):
+          ...
+        TimeoutError: No complete frame in the framebuffer
+        >>> reader.close()
+        >>> fb.close()
+    """
+    def __init__(self, buf, size, maxrects, closer=None, generation=0):
+        self.buf = buf
+        self.size = size
+        self.maxrects = maxrects
+        self.generation = generation
+        self.pixels_offset = RECTS_OFFSET + RECT.size * maxrects
+        self.frame = 0
+        self.path = None # Set for files, see resize
+        self._closer = closer
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, maxrects, *size, generation)
+        FRAME.pack_into(buf, FRAME_OFFSET, 0, 0, 0)
+
+    @classmethod
+    def create_file(cls, path, size, maxrects=64, generation=0):
+        """ Creates the framebuffer in a new file and renames it to path, replacing any file there """
+        length = framebuffer_size(size, maxrects)
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                       prefix=f'.{os.path.basename(path)}.')
+        f = os.fdopen(fd, 'w+b')
+        try:
+            f.truncate(length)
+            buf = mmap.mmap(f.fileno(), length)
+        except:
+            f.close()
+            os.unlink(tmppath)
+            raise
+        def closer():
+            buf.close()
+            f.close()
+        fb = cls(buf, size, maxrects, closer, generation)
+        os.replace(tmppath, path)
+        fb.path = path
+        return fb
+
+    @classmethod
+    def create_shared(cls, name, size, maxrects=64):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=framebuffer_size(size, maxrects))
+        def closer():
+            shm.close()
+            shm.unlink()
+        return cls(shm.buf, size, maxrects, closer)
+
+    def close(self):
+        self.buf = None
+        if self._closer is not None:
+            self._closer()
+
+    def resize(self, size):
+        """
+        A framebuffer of size in a new file put in place of this one, which is marked replaced and closed.
+        Only for files, a shared memory segment can just be created again under another name.
+        """
+        if self.path is None:
+            raise ValueError('Only a framebuffer file can be resized')
+        new = self.create_file(self.path, size, self.maxrects, self.generation + 1)
+        FRAME.pack_into(self.buf, FRAME_OFFSET, self.frame, 0, 1)
+        self.close()
+        return new
+
+    def write(self, img, rects):
+        """ Copies the rectangles (x1, y1, x2, y2) of img in as the next frame """
+        rects = list(dict.fromkeys(rects))
+        if len(rects) > self.maxrects:
+            rects = [(0, 0) + self.size]
+        buf = self.buf
+        stride = self.size[0] * 4
+
+        FRAME.pack_into(buf, FRAME_OFFSET, self.frame + 1, 0, 0)
+        for rect in rects:
+            x1, y1, x2, y2 = rect
+            data = img.crop(rect).tobytes()
+            width = (x2 - x1) * 4
+            for y in range(y2 - y1):
+                start = self.pixels_offset + (y1 + y) * stride + x1 * 4
+                buf[start:start + width] = data[y * width:(y + 1) * width]
+        for i, rect in enumerate(rects):
+            RECT.pack_into(buf, RECTS_OFFSET + i * RECT.size, *rect)
+        self.frame += 2
+        FRAME.pack_into(buf, FRAME_OFFSET, self.frame, len(rects), 0)
+
+class FrameReader:
+    """ The reading end of a framebuffer, see FrameBuffer """
+    def __init__(self, buf, closer=None, path=None):
+        self.path = path # Set for files, so that a replaced one can be mapped again
+        self._map(buf, closer)
+
+    def _map(self, buf, closer):
+        magic, version, maxrects, width, height, generation = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a version {VERSION} PySweeper framebuffer')
+        self.buf = buf
+        self.size = (width, height)
+        self.maxrects = maxrects
+        self.generation = generation
+        self.pixels_offset = RECTS_OFFSET + RECT.size * maxrects
+        self._closer = closer
+
+    @staticmethod
+    def _map_file(path):
+        with open(path, 'r+b') as f:
+            return mmap.mmap(f.fileno(), 0)
+
+    @classmethod
+    def open_file(cls, path):
+        buf = cls._map_file(path)
+        return cls(buf, buf.close, path)
+
+    @classmethod
+    def open_shared(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm.buf, shm.close)
+
+    def close(self):
+        self.buf = None
+        if self._closer is not None:
+            self._closer()
+
+    @property
+    def frame(self):
+        return FRAME.unpack_from(self.buf, FRAME_OFFSET)[0]
+
+    @property
+    def replaced(self):
+        """ Whether the writer has put a new file in place of the one mapped """
+        return FRAME.unpack_from(self.buf, FRAME_OFFSET)[2] != 0
+
+    def remap(self):
+        """ Maps the file at path again, which is a new one once replaced is set """
+        buf = self._map_file(self.path)
+        self.close()
+        self._map(buf, buf.close)
+
+    def _follow(self):
+        """ Remaps the file if it was replaced, returning whether it was """
+        if self.path is None or not self.replaced:
+            return False
+        self.remap()
+        return True
+
+    def _consistent(self, copy, timeout):
+        """ copy() between two reads of the same even frame counter, as (frame, n, copy()) """
+        deadline = time.monotonic() + timeout
+        while True:
+            frame, n, replaced = FRAME.unpack_from(self.buf, FRAME_OFFSET)
+            if frame % 2 == 0:
+                result = copy(n)
+                if FRAME.unpack_from(self.buf, FRAME_OFFSET)[0] == frame:
+                    return frame, result
+            if time.monotonic() > deadline:
+                raise TimeoutError('No complete frame in the framebuffer')
+            time.sleep(0)
+
+    def _rects(self, n):
+        return [RECT.unpack_from(self.buf, RECTS_OFFSET + i * RECT.size) for i in range(n)]
+
+    def read(self, timeout=1.0):
+        """
+        (frame counter, dirty rectangles) of the last complete frame.
+        Raises TimeoutError if there is none within timeout seconds.
+        After the file was replaced, the new one is mapped and the whole display is listed.
+        """
+        remapped = self._follow()
+        frame, rects = self._consistent(self._rects, timeout)
+        if remapped:
+            rects = [(0, 0) + self.size]
+        return frame, rects
+
+    def snapshot(self, timeout=1.0):
+        """ (frame counter, dirty rectangles, copy of the pixels) of the last complete frame """
+        remapped = self._follow()
+        frame, (rects, img) = self._consistent(
+            lambda n: (self._rects(n), Image.frombytes('RGBA', self.size, bytes(self.pixels()))),
+            timeout)
+        if remapped:
+            rects = [(0, 0) + self.size]
+        return frame, rects, img
+
+    def pixels(self):
+        """ The RGBA pixels, as a memoryview of the mapping itself """
+        return memoryview(self.buf)[self.pixels_offset:self.pixels_offset + self.size[0] * self.size[1] * 4]
+
+    def image(self):
+        """ The pixels as a PIL image sharing the mapping's memory """
+        return Image.frombuffer('RGBA', self.size, self.pixels(), 'raw', 'RGBA', 0, 1)
+
+class MappedDisplayImage(DisplayImage):
+    """
+    A DisplayImage that also publishes its frames into a FrameBuffer.
+    Call publish after drawing a frame, which copies the dirty rectangles across.
+    """
+    def __init__(self, pil_image, framebuffer=None):
+        DisplayImage.__init__(self, pil_image)
+        self.framebuffer = framebuffer
+
+    def publish(self):
+        """
+        Copies everything repainted since the last publish into the framebuffer.
+        Returns the dirty rectangles taken, for the caller to upload elsewhere too.
+        """
+        rects = self.take_dirty()
+        if self.framebuffer is not None and rects:
+            self.framebuffer.write(self.pil_image, rects)
+        return rects
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
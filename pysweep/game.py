@@ -0,0 +1,203 @@
+"""
+Minesweeper game logic
+
+Game knows nothing about the Display.
+What the player can see is kept as a grid of TileState classes,
+and every action returns the (row, col, state) changes it made,
+so a Display (or anything else) can update just those tiles.
+"""
+
+import random
+
+from .display import TileState
+
+
+class Game:
+    """
+    A single game of minesweeper.
+
+    Mines are placed on the first open, avoiding the opened tile,
+    using an RNG seeded with seed so a game can be reproduced exactly.
+
+        >>> game = Game(4, 4, 3, seed=1)
+        >>> len(game.open(0, 0))
+        8
+        >>> print(game)
+        001.
+        012.
+        12..
+        ....
+        >>> game.flag(0, 3)
+        [(0, 3, <class 'pysweep.display.TileState.Flag'>)]
+        >>> game.minesleft
+        2
+        >>> game.chord(0, 2)
+        [(1, 3, <class 'pysweep.display.Number_2'>)]
+
+    Opening a mine loses and reveals the rest of the board
+        >>> changes = game.open(3, 1)
+        >>> game.status
+        'lost'
+        >>> print(game)
+        001F
+        0122
+        12*.
+        .X..
+
+    The same seed and actions always play out the same way
+        >>> other = Game(4, 4, 3, seed=1)
+        >>> for action in [('open', 0, 0), ('flag', 0, 3), ('chord', 0, 2), ('open', 3, 1)]:
+        ...     _ = other.act(*action)
+        >>> str(other) == str(game)
+        True
+        >>> other.act('open', -1, 0)
+        Traceback (most recent call last):
+          ...
+        ValueError: No tile at row -1, col 0
+
+    Opening every safe tile wins and flags the mines
+        >>> game = Game(2, 2, 1, seed=3)
+        >>> for i, j in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        ...     if game.minefield is None or (i, j) not in game.minefield:
+        ...         _ = game.open(i, j)
+        >>> game.status, game.minesleft
+        ('won', 0)
+    """
+    SYMBOLS = {
+        TileState.Unopened: '.',
+        TileState.Flag: 'F',
+        TileState.FlagWrong: 'f',
+        TileState.Mine: '*',
+        TileState.Blast: 'X',
+    }
+    SYMBOLS.update((state, str(state.n)) for state in TileState.Number)
+
+    def __init__(self, rows, cols, mines, seed=None):
+        if not 0 <= mines < rows * cols:
+            raise ValueError('Need at least one tile without a mine')
+        self.rows, self.cols, self.mines = rows, cols, mines
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.minefield = None # Set of (row, col), placed on the first open
+        self.counts = None    # counts[row][col] is the number of neighbouring mines
+        self.tiles = [[TileState.Unopened] * cols for i in range(rows)]
+
+        self.status = 'ready' # then 'playing', then 'won' or 'lost'
+        self.flags = 0
+        self.opened = 0
+
+    def __str__(self):
+        return '\n'.join(''.join(self.SYMBOLS[state] for state in row) for row in self.tiles)
+
+    @property
+    def minesleft(self):
+        return self.mines - self.flags
+
+    @property
+    def finished(self):
+        return self.status in ('won', 'lost')
+
+    def neighbours(self, row, col):
+        for i in range(max(row-1, 0), min(row+2, self.rows)):
+            for j in range(max(col-1, 0), min(col+2, self.cols)):
+                if (i, j) != (row, col):
+                    yield (i, j)
+
+    def place_mines(self, safe):
+        cells = [(i, j) for i in range(self.rows) for j in range(self.cols) if (i, j) != safe]
+        self.minefield = set(self.rng.sample(cells, self.mines))
+        self.counts = [[sum((n in self.minefield) for n in self.neighbours(i, j))
+                        for j in range(self.cols)]
+                       for i in range(self.rows)]
+
+    def act(self, action, row, col):
+        """ Calls open, flag or chord by name """
+        if action not in ('open', 'flag', 'chord'):
+            raise ValueError(f'Unknown action {action!r}')
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError(f'No tile at row {row}, col {col}')
+        return getattr(self, action)(row, col)
+
+    def _set(self, changes, row, col, state):
+        self.tiles[row][col] = state
+        changes.append((row, col, state))
+
+    def open(self, row, col):
+        if self.finished or self.tiles[row][col] is not TileState.Unopened:
+            return []
+        if self.minefield is None:
+            self.place_mines((row, col))
+            self.status = 'playing'
+
+        changes = []
+        if (row, col) in self.minefield:
+            self._lose(changes, row, col)
+            return changes
+
+        self._flood(changes, row, col)
+        if self.opened == self.rows * self.cols - self.mines:
+            self._win(changes)
+        return changes
+
+    def _flood(self, changes, row, col):
+        stack = [(row, col)]
+        while stack:
+            i, j = stack.pop()
+            if self.tiles[i][j] is not TileState.Unopened:
+                continue
+            n = self.counts[i][j]
+            self._set(changes, i, j, TileState.Number[n])
+            self.opened += 1
+            if n == 0:
+                stack.extend(self.neighbours(i, j))
+
+    def flag(self, row, col):
+        if self.finished:
+            return []
+        changes = []
+        state = self.tiles[row][col]
+        if state is TileState.Unopened:
+            self._set(changes, row, col, TileState.Flag)
+            self.flags += 1
+        elif state is TileState.Flag:
+            self._set(changes, row, col, TileState.Unopened)
+            self.flags -= 1
+        return changes
+
+    def chord(self, row, col):
+        """ Opens the neighbours of a number whose mines are all flagged """
+        n = getattr(self.tiles[row][col], 'n', None)
+        if self.finished or n is None:
+            return []
+        neighbours = list(self.neighbours(row, col))
+        if sum(self.tiles[i][j] is TileState.Flag for i, j in neighbours) != n:
+            return []
+        changes = []
+        for i, j in neighbours:
+            if self.tiles[i][j] is TileState.Unopened:
+                changes.extend(self.open(i, j))
+        return changes
+
+    def _lose(self, changes, row, col):
+        self.status = 'lost'
+        self._set(changes, row, col, TileState.Blast)
+        for i in range(self.rows):
+            for j in range(self.cols):
+                state = self.tiles[i][j]
+                mine = (i, j) in self.minefield
+                if state is TileState.Unopened and mine and (i, j) != (row, col):
+                    self._set(changes, i, j, TileState.Mine)
+                elif state is TileState.Flag and not mine:
+                    self._set(changes, i, j, TileState.FlagWrong)
+
+    def _win(self, changes):
+        self.status = 'won'
+        for i, j in sorted(self.minefield):
+            if self.tiles[i][j] is TileState.Unopened:
+                self._set(changes, i, j, TileState.Flag)
+                self.flags += 1
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
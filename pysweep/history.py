@@ -0,0 +1,229 @@
+"""
+Game history with copy-on-write board snapshots
+
+A Snapshot is an immutable board of TileStates split into square chunks.
+Changing some cells makes a new Snapshot that shares every untouched chunk,
+so a version costs the chunks it changed plus one tuple of chunk references.
+
+History records the changes made by every action,
+and keeps a Snapshot as a checkpoint every few actions.
+Any past state is rebuilt from the nearest checkpoint before it
+plus at most a checkpoint's worth of changes,
+and seeking only touches the cells that differ.
+"""
+
+from .display import TileState
+
+
+class Snapshot:
+    """
+    An immutable chunked board.
+
+        >>> grid = [[TileState.Unopened] * 20 for i in range(20)]
+        >>> a = Snapshot.from_grid(grid, chunksize=8)
+        >>> b = a.set([(0, 0, TileState.Flag), (19, 19, TileState.Flag)])
+        >>> a[0, 0].name, b[0, 0].name, b[19, 19].name
+        ('unopened.png', 'flag.png', 'flag.png')
+
+    Only the touched chunks are copied
+        >>> sum(x is not y for x, y in zip(a.chunks, b.chunks)), len(a.chunks)
+        (2, 9)
+        >>> sorted((i, j) for i, j, state in b.diff(a))
+        [(0, 0), (19, 19)]
+        >>> b.grid() == [[b[i, j] for j in range(20)] for i in range(20)]
+        True
+    """
+    def __init__(self, rows, cols, chunksize, chunks):
+        self.rows, self.cols = rows, cols
+        self.chunksize = chunksize
+        self.chunkcols = -(-cols // chunksize)
+        self.chunks = chunks # Tuple of chunks, each a tuple of chunksize*chunksize states
+
+    @classmethod
+    def from_grid(cls, grid, chunksize=8):
+        rows, cols = len(grid), len(grid[0])
+        n = chunksize
+        chunks = []
+        for ci in range(0, rows, n):
+            for cj in range(0, cols, n):
+                chunks.append(tuple(
+                    grid[i][j] if i < rows and j < cols else None
+                    for i in range(ci, ci + n) for j in range(cj, cj + n)))
+        return cls(rows, cols, chunksize, tuple(chunks))
+
+    def _locate(self, row, col):
+        n = self.chunksize
+        return (row // n) * self.chunkcols + col // n, (row % n) * n + col % n
+
+    def __getitem__(self, cell):
+        chunk, i = self._locate(*cell)
+        return self.chunks[chunk][i]
+
+    def set(self, changes):
+        """ A new Snapshot with the (row, col, state) changes made """
+        touched = {}
+        for row, col, state in changes:
+            chunk, i = self._locate(row, col)
+            if chunk not in touched:
+                touched[chunk] = list(self.chunks[chunk])
+            touched[chunk][i] = state
+        if not touched:
+            return self
+        chunks = list(self.chunks)
+        for chunk, cells in touched.items():
+            chunks[chunk] = tuple(cells)
+        return Snapshot(self.rows, self.cols, self.chunksize, tuple(chunks))
+
+    def diff(self, other):
+        """ (row, col, state in self) of every cell where self and other differ """
+        n = self.chunksize
+        changes = []
+        for chunk, (mine, theirs) in enumerate(zip(self.chunks, other.chunks)):
+            if mine is theirs:
+                continue
+            ci, cj = divmod(chunk, self.chunkcols)
+            for i, (state, old) in enumerate(zip(mine, theirs)):
+                if state is not old:
+                    di, dj = divmod(i, n)
+                    changes.append((ci * n + di, cj * n + dj, state))
+        return changes
+
+    def grid(self):
+        return [[self[i, j] for j in range(self.cols)] for i in range(self.rows)]
+
+class Version:
+    """ What History keeps per action """
+    __slots__ = ('changes', 'status', 'flags', 'opened', 'minefield', 'counts', 'rng')
+
+    def __init__(self, changes, game, previous=None):
+        self.changes = changes # (row, col, old state, new state)
+        self.status, self.flags, self.opened = game.status, game.flags, game.opened
+        self.minefield, self.counts = game.minefield, game.counts
+        self.rng = game.rng.getstate()
+        if previous is not None and previous.rng == self.rng:
+            self.rng = previous.rng # Only placing the mines uses the rng, so share the state otherwise
+
+class History:
+    """
+    Unlimited undo, redo and seeking for a Game.
+
+        >>> from .game import Game
+        >>> game = Game(16, 30, 99, seed=2)
+        >>> history = History(game, checkpoint=4)
+        >>> for action in [('open', 8, 8), ('flag', 0, 0), ('flag', 0, 1), ('flag', 15, 29),
+        ...                ('flag', 0, 0), ('flag', 5, 5)]:
+        ...     _ = history.act(*action)
+        >>> after = str(game)
+        >>> len(history), history.position
+        (7, 6)
+
+    Undo returns the changes that put the board back, for the display
+        >>> history.undo()
+        [(5, 5, <class 'pysweep.display.TileState.Unopened'>)]
+        >>> game.flags
+        2
+
+    Seeking anywhere gives the same board as playing to that point
+        >>> replay = Game(16, 30, 99, seed=2)
+        >>> _ = replay.act('open', 8, 8)
+        >>> changes = history.seek(1)
+        >>> str(game) == str(replay), game.flags
+        (True, 0)
+        >>> _ = history.seek(6)
+        >>> str(game) == after
+        True
+
+    Snapshots share every chunk an action didn't touch
+        >>> history.chunks() < 2 * len(history.snapshot(0).chunks)
+        True
+
+    Acting after an undo drops the undone actions
+        >>> _ = history.seek(2)
+        >>> _ = history.act('flag', 3, 3)
+        >>> len(history), history.redo()
+        (4, [])
+
+    Undoing the first open and opening again places the same mines
+        >>> _ = history.seek(0)
+        >>> _ = history.act('open', 8, 8)
+        >>> str(game) == str(replay)
+        True
+    """
+    def __init__(self, game, checkpoint=32, chunksize=8):
+        self.game = game
+        self.checkpoint = checkpoint
+        self.versions = [Version([], game)]
+        self.checkpoints = {0: Snapshot.from_grid(game.tiles, chunksize)} # Map of version to Snapshot
+        self.current = self.checkpoints[0]
+        self.position = 0
+
+    def __len__(self):
+        return len(self.versions)
+
+    def act(self, action, row, col):
+        """ Game.act, recorded. Returns the changes like Game.act """
+        if self.position < len(self.versions) - 1:
+            del self.versions[self.position + 1:]
+            for v in [v for v in self.checkpoints if v > self.position]:
+                del self.checkpoints[v]
+
+        before = self.current
+        changes = self.game.act(action, row, col)
+        self.current = before.set(changes)
+        latest = {(i, j): state for i, j, state in changes} # A cell can change more than once
+        recorded = [(i, j, before[i, j], state) for (i, j), state in latest.items()]
+        self.versions.append(Version(recorded, self.game, self.versions[-1]))
+        self.position = len(self.versions) - 1
+        if self.position % self.checkpoint == 0:
+            self.checkpoints[self.position] = self.current
+        return changes
+
+    def snapshot(self, version):
+        """ The board after version actions """
+        base = version - version % self.checkpoint
+        snapshot = self.checkpoints[base]
+        if base == version:
+            return snapshot
+        cells = {}
+        for v in self.versions[base + 1:version + 1]:
+            for i, j, old, new in v.changes:
+                cells[i, j] = new
+        return snapshot.set((i, j, state) for (i, j), state in cells.items())
+
+    def seek(self, version):
+        """ Puts the game back to how it was after version actions, returns the tile changes """
+        if not 0 <= version < len(self.versions):
+            raise IndexError(f'No version {version}')
+        target = self.snapshot(version)
+        changes = target.diff(self.current)
+
+        game = self.game
+        for i, j, state in changes:
+            game.tiles[i][j] = state
+        v = self.versions[version]
+        game.status, game.flags, game.opened = v.status, v.flags, v.opened
+        game.minefield, game.counts = v.minefield, v.counts
+        game.rng.setstate(v.rng)
+
+        self.current = target
+        self.position = version
+        return changes
+
+    def undo(self):
+        if self.position == 0:
+            return []
+        return self.seek(self.position - 1)
+
+    def redo(self):
+        if self.position == len(self.versions) - 1:
+            return []
+        return self.seek(self.position + 1)
+
+    def chunks(self):
+        """ Number of distinct chunks held by the checkpoints and the current board """
+        held = {id(chunk) for s in list(self.checkpoints.values()) + [self.current] for chunk in s.chunks}
+        return len(held)
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
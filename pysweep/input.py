@@ -0,0 +1,310 @@
+"""
+Input pipeline
+
+Three layers, each only talking to the next:
+
+    RawInput        Tk callbacks. Only takes a timestamp and appends to a queue.
+    EventProcessor  Once per frame, turns the queued raw inputs into InputEvents,
+                    coalescing redundant motion and press/release pairs
+                    and mapping pixel coordinates to targets.
+    ActionMapper    Turns InputEvents into player Actions (open, flag, chord, ...).
+
+InputPipeline glues them together and drains the queue once per frame,
+so however fast the mouse is, the Tk event loop only ever does an append.
+"""
+
+import time
+from collections import deque, namedtuple
+
+
+RawEvent = namedtuple('RawEvent', 'kind button x y time')
+InputEvent = namedtuple('InputEvent', 'kind button target time')
+Action = namedtuple('Action', 'kind target time')
+
+""" Raw inputs """
+
+class RawInput:
+    """
+    Hooks into a Tk widget and queues raw inputs.
+
+    The callbacks only take a timestamp and append to the queue,
+    everything else happens later in EventProcessor.
+
+        >>> from types import SimpleNamespace as E
+        >>> raw = RawInput(clock=lambda: 0)
+        >>> raw.press(E(num=1, x=5, y=6))
+        >>> raw.motion(E(x=7, y=8))
+        >>> raw.release(E(num=1, x=7, y=8))
+        >>> list(raw.queue)
+        [RawEvent(kind='press', button=1, x=5, y=6, time=0), \
+RawEvent(kind='motion', button=None, x=7, y=8, time=0), \
+RawEvent(kind='release', button=1, x=7, y=8, time=0)]
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.queue = deque()
+        self.clock = clock
+
+    def bind(self, widget): # pragma: no cover
+        widget.bind('<ButtonPress>', self.press)
+        widget.bind('<ButtonRelease>', self.release)
+        widget.bind('<Motion>', self.motion)
+
+    def press(self, e):
+        self.queue.append(RawEvent('press', e.num, e.x, e.y, self.clock()))
+
+    def release(self, e):
+        self.queue.append(RawEvent('release', e.num, e.x, e.y, self.clock()))
+
+    def motion(self, e):
+        self.queue.append(RawEvent('motion', None, e.x, e.y, self.clock()))
+
+""" Raw inputs into events """
+
+class TargetMapper:
+    """
+    Maps pixel coordinates to ('tile', row, col), ('face',) or None,
+    using Display.hittest, which is O(1) however large the board is.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> display = Display(DisplayImage(None), skin, boardcols=8, boardrows=8)
+        >>> mapper = TargetMapper(display)
+
+        >>> x, y = display.tiles[3][5].offset
+        >>> mapper.target(x, y), mapper.target(x+31, y+31), mapper.target(x+32, y)
+        (('tile', 3, 5), ('tile', 3, 5), ('tile', 3, 6))
+        >>> mapper.target(*display.face.offset)
+        ('face',)
+        >>> mapper.target(0, 0) is None
+        True
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    TARGETS = ('tile', 'face') # Parts that actions happen on
+
+    def __init__(self, display):
+        self.display = display
+
+    def target(self, x, y):
+        target = self.display.hittest(x, y)
+        if target is not None and target[0] in self.TARGETS:
+            return target
+        return None
+
+class EventProcessor:
+    """
+    Turns queued RawEvents into InputEvents.
+
+    Motion is only reported when the target under the mouse changes,
+    and a press followed by a release of the same button on the same target
+    is reported as a single 'click', timestamped by the release
+    since that is the input the resulting action answers.
+
+        >>> class Mapper:
+        ...     def target(self, x, y):
+        ...         return ('tile', y//10, x//10)
+        >>> raw = deque([RawEvent('motion', None, 1, 1, 0),
+        ...              RawEvent('motion', None, 2, 2, 1),
+        ...              RawEvent('motion', None, 12, 2, 2),
+        ...              RawEvent('motion', None, 15, 3, 3),
+        ...              RawEvent('press', 1, 15, 3, 4),
+        ...              RawEvent('motion', None, 16, 3, 5),
+        ...              RawEvent('release', 1, 16, 3, 6),
+        ...              RawEvent('press', 3, 16, 3, 7)])
+        >>> ep = EventProcessor(Mapper())
+        >>> for e in ep.process(raw): print(e)
+        InputEvent(kind='motion', button=None, target=('tile', 0, 1), time=3)
+        InputEvent(kind='click', button=1, target=('tile', 0, 1), time=6)
+        InputEvent(kind='press', button=3, target=('tile', 0, 1), time=7)
+        >>> len(raw)
+        0
+    """
+    def __init__(self, mapper):
+        self.mapper = mapper
+        self.lasttarget = None
+
+    def process(self, queue):
+        events = []
+        motion = None
+
+        def flush_motion():
+            target = self.mapper.target(motion.x, motion.y)
+            if target != self.lasttarget:
+                self.lasttarget = target
+                events.append(InputEvent('motion', None, target, motion.time))
+
+        while queue:
+            raw = queue.popleft()
+            if raw.kind == 'motion':
+                motion = raw
+                continue
+            if motion is not None:
+                flush_motion()
+                motion = None
+
+            target = self.lasttarget = self.mapper.target(raw.x, raw.y)
+            if (raw.kind == 'release' and events and
+                events[-1].kind == 'press' and
+                events[-1].button == raw.button and
+                events[-1].target == target):
+                events[-1] = InputEvent('click', raw.button, target, raw.time)
+            else:
+                events.append(InputEvent(raw.kind, raw.button, target, raw.time))
+
+        if motion is not None:
+            flush_motion()
+
+        return events
+
+""" Events into actions """
+
+class ActionMapper:
+    """
+    Turns InputEvents into player Actions.
+
+    Action kinds:
+        press   a tile or the face is held down (show it depressed)
+        move    the held down target changed
+        cancel  the press was released somewhere else
+        open    a tile is opened
+        flag    a tile is flagged or unflagged
+        chord   the neighbours of a tile are opened
+        face    the face was clicked
+
+        >>> am = ActionMapper()
+        >>> t = ('tile', 0, 0)
+        >>> am.process([InputEvent('click', 1, t, 0)])
+        [Action(kind='open', target=('tile', 0, 0), time=0)]
+        >>> am.process([InputEvent('press', 3, t, 1)])
+        [Action(kind='flag', target=('tile', 0, 0), time=1)]
+        >>> am.process([InputEvent('release', 3, t, 2),
+        ...             InputEvent('press', 1, t, 3),
+        ...             InputEvent('motion', None, ('tile', 0, 1), 4),
+        ...             InputEvent('press', 3, ('tile', 0, 1), 5),
+        ...             InputEvent('release', 3, ('tile', 0, 1), 6),
+        ...             InputEvent('release', 1, ('tile', 0, 1), 7)])
+        [Action(kind='press', target=('tile', 0, 0), time=3), \
+Action(kind='move', target=('tile', 0, 1), time=4), \
+Action(kind='chord', target=('tile', 0, 1), time=6)]
+        >>> am.process([InputEvent('click', 1, ('face',), 8)])
+        [Action(kind='face', target=('face',), time=8)]
+    """
+    def __init__(self, left=1, right=3, middle=2):
+        self.left, self.right, self.middle = left, right, middle
+        self.held = set()
+        self.pressed = None # Target held down with the left button
+        self.chording = False
+
+    def process(self, events):
+        actions = []
+        for e in events:
+            self.event(e, actions)
+        return actions
+
+    def event(self, e, actions):
+        if e.kind == 'click':
+            start = len(actions)
+            self.event(InputEvent('press', e.button, e.target, e.time), actions)
+            self.event(InputEvent('release', e.button, e.target, e.time), actions)
+            # The press would never be seen, so don't bother showing it
+            if len(actions) - start == 2 and actions[start].kind == 'press':
+                del actions[start]
+            return
+
+        if e.kind == 'motion':
+            if self.pressed is not None and e.target != self.pressed:
+                self.pressed = e.target
+                actions.append(Action('move', e.target, e.time))
+            return
+
+        if e.kind == 'press':
+            self.held.add(e.button)
+            if e.button == self.middle or self.held >= {self.left, self.right}:
+                self.chording = True
+                self.pressed = e.target
+            elif e.button == self.left:
+                self.pressed = e.target
+                actions.append(Action('press', e.target, e.time))
+            elif e.button == self.right and e.target and e.target[0] == 'tile':
+                actions.append(Action('flag', e.target, e.time))
+            return
+
+        if e.kind == 'release':
+            self.held.discard(e.button)
+            if self.chording:
+                # The chord fires on the first release
+                if self.pressed is not None and self.pressed[0] == 'tile':
+                    actions.append(Action('chord', self.pressed, e.time))
+                self.chording = False
+                self.pressed = None
+            elif e.button == self.left and self.pressed is not None:
+                if e.target != self.pressed or e.target is None:
+                    actions.append(Action('cancel', self.pressed, e.time))
+                elif e.target[0] == 'tile':
+                    actions.append(Action('open', e.target, e.time))
+                elif e.target[0] == 'face':
+                    actions.append(Action('face', e.target, e.time))
+                self.pressed = None
+
+class InputPipeline:
+    """
+    Binds RawInput, EventProcessor and ActionMapper together.
+
+    Call process once per frame (or use schedule),
+    every resulting Action is passed to handler.
+
+        >>> from types import SimpleNamespace as E
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> display = Display(DisplayImage(None), skin, boardcols=8, boardrows=8)
+
+        >>> import itertools
+        >>> actions = []
+        >>> pipeline = InputPipeline(display, actions.append, clock=itertools.count().__next__)
+        >>> x, y = display.tiles[1][2].offset
+        >>> for i in range(100):
+        ...     pipeline.raw.motion(E(x=x+i%10, y=y))
+        >>> pipeline.raw.press(E(num=1, x=x, y=y))
+        >>> pipeline.raw.release(E(num=1, x=x, y=y))
+        >>> pipeline.process()
+        [Action(kind='open', target=('tile', 1, 2), time=101)]
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, display, handler, clock=time.perf_counter, tracker=None):
+        self.handler = handler
+        self.tracker = tracker # latency.LatencyTracker, optional
+        self.raw = RawInput(clock)
+        self.events = EventProcessor(TargetMapper(display))
+        self.actions = ActionMapper()
+        self._after_id = None
+
+    def bind(self, widget): # pragma: no cover
+        self.raw.bind(widget)
+
+    def process(self):
+        events = self.events.process(self.raw.queue)
+        actions = self.actions.process(events)
+        if self.tracker is not None:
+            for event in events:
+                self.tracker.event(event.time)
+            for action in actions:
+                self.tracker.action(action.time)
+                self.handler(action)
+        else:
+            for action in actions:
+                self.handler(action)
+        return actions
+
+    def schedule(self, widget, interval=16): # pragma: no cover
+        """ Processes the queue every interval milliseconds using widget.after """
+        def frame():
+            self.process()
+            self._after_id = widget.after(interval, frame)
+        self._after_id = widget.after(interval, frame)
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,177 @@
+"""
+Canvas item rendering backend
+
+Instead of compositing the whole display into one framebuffer,
+every Tile, Digit and Face becomes its own image item on a Tk canvas,
+showing one of a set of PhotoImages shared by every sprite (one per distinct skin image).
+The static chrome (borders, panel and board backgrounds) is drawn once
+into a single background item.
+
+A sprite's draw then just points its item at another PhotoImage with itemconfigure,
+and Tk repaints the damaged area itself,
+so the cost of a click no longer depends on the size of the display.
+"""
+
+from PIL import Image
+
+from .display import DisplayImage
+
+
+class SpriteItem(DisplayImage):
+    """
+    Stands in for the DisplayImage of a single sprite.
+    Pasting an image reconfigures the sprite's canvas item to show it instead.
+    """
+    def __init__(self, items, item):
+        self.items = items
+        self.item = item
+
+    def paste(self, img, coords):
+        self.items.canvas.itemconfigure(self.item, image=self.items.photo(img))
+
+    def paste_pixel(self, pixel, coords):
+        x1, y1, x2, y2 = coords
+        self.paste(self.items.solid(pixel, (x2 - x1, y2 - y1)), (x1, y1))
+
+    def invalidate(self, coords):
+        pass # Tk tracks damage to its own items
+
+    def take_dirty(self):
+        return []
+
+class BackgroundItem(DisplayImage):
+    """
+    Stands in for the DisplayImage of the display itself.
+    The static layer is already on the background item,
+    so a full draw of the display only has its sprites reconfigure their items
+    instead of compositing a frame no one sees.
+    """
+    def paste(self, img, coords):
+        pass
+
+    def paste_pixel(self, pixel, coords):
+        pass
+
+    def invalidate(self, coords):
+        pass
+
+class CanvasItems:
+    """
+    Moves the sprites of display onto items of canvas.
+
+    canvas needs create_image and itemconfigure like tkinter.Canvas,
+    photo turns a PIL image into something canvas can show (ImageTk.PhotoImage).
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, TileState
+
+        >>> class FakeCanvas:
+        ...     def __init__(self):
+        ...         self.items = []
+        ...     def create_image(self, x, y, image, anchor):
+        ...         self.items.append(image)
+        ...         return len(self.items) - 1
+        ...     def itemconfigure(self, item, image):
+        ...         self.items[item] = image
+
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> display = Display(DisplayImage(None), skin, boardcols=8, boardrows=8)
+        >>> canvas = FakeCanvas()
+        >>> items = CanvasItems(display, canvas, photo=lambda img: img)
+        >>> len(canvas.items) # Background, 64 tiles, 6 digits and the face
+        72
+
+    Sprites share one photo per skin image
+        >>> len(items.photos) < 10
+        True
+
+    A state change is a single itemconfigure of the sprite's item
+        >>> tile = display.tiles[2][3]
+        >>> tile.state = TileState.Number[3]
+        >>> tile.draw()
+        >>> canvas.items[tile.image.item] is tile.img
+        True
+
+    Drawing the whole display only reconfigures items, the background is left alone
+        >>> background = items.background.tobytes()
+        >>> display.tiles[0][0].state = TileState.Flag
+        >>> display.draw()
+        >>> canvas.items[display.tiles[0][0].image.item] is display.tiles[0][0].img
+        True
+        >>> items.background.tobytes() == background
+        True
+
+    Solid colours become a shared photo of the sprite's size
+        >>> tile.image.paste_pixel((255, 0, 0, 255), tile.boxcoords)
+        >>> canvas.items[tile.image.item].getpixel((0, 0)), canvas.items[tile.image.item].size == tile.size
+        ((255, 0, 0, 255), True)
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, display, canvas, photo):
+        self.display = display
+        self.canvas = canvas
+        self._photo = photo
+        self.photos = {} # Map of id(PIL image) to (PIL image, photo)
+        self.solids = {} # Map of (pixel, size) to a PIL image of that colour
+
+        # The chrome goes into the background item
+        self.background = display.static_layer().copy()
+        self.backgroundimage = DisplayImage(self.background)
+        for box in display.walk():
+            box.image = self.backgroundimage
+        display.image = BackgroundItem(None)
+        self.backgroundphoto = photo(self.background)
+        self.backgrounditem = canvas.create_image(0, 0, image=self.backgroundphoto, anchor='nw')
+
+        # Then give every sprite an item of its own
+        for sprite in display.sprites():
+            item = canvas.create_image(*sprite.offset, image=self.photo(sprite.img), anchor='nw')
+            sprite.image = SpriteItem(self, item)
+
+    def photo(self, img):
+        """ The shared photo showing img """
+        try:
+            return self.photos[id(img)][1]
+        except KeyError:
+            # Keep img alive too, so its id isn't reused
+            photo = self._photo(img)
+            self.photos[id(img)] = (img, photo)
+            return photo
+
+    def solid(self, pixel, size):
+        """ A PIL image of size filled with pixel, the same one for every sprite """
+        try:
+            return self.solids[(pixel, size)]
+        except KeyError:
+            img = self.solids[(pixel, size)] = Image.new('RGBA', size, pixel)
+            return img
+
+try: # pragma: no cover
+    import tkinter
+    from PIL import ImageTk
+
+    class ItemDisplayCanvas(tkinter.Canvas):
+        """ Shows a Display as one canvas item per sprite """
+        def __init__(self, master, display, tracker=None):
+            self.master = master
+            self.display = display
+            self.tracker = tracker # latency.LatencyTracker, optional
+            self.size = display.size
+
+            super().__init__(self.master, width=self.size[0], height=self.size[1], highlightthickness=0)
+
+            self.items = CanvasItems(display, self, ImageTk.PhotoImage)
+
+        def draw(self):
+            # Items were already reconfigured as the sprites drew,
+            # Tk repaints them the next time it is idle
+            if self.tracker is not None:
+                self.tracker.mark('redraw')
+                self.tracker.mark('present')
+except ImportError: # pragma: no cover
+    pass
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
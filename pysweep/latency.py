@@ -0,0 +1,165 @@
+"""
+Input-to-photon latency instrumentation
+
+Every raw input is timestamped by RawInput.
+From that timestamp, a LatencyTracker records how long it took to reach each stage:
+
+    event    the raw input was turned into an InputEvent
+    action   the resulting Action was handed to the game
+    redraw   the Display finished redrawing
+    present  DisplayCanvas.draw finished pushing the pixels to Tk
+
+Set PYSWEEP_LATENCY_LOG to a filename to have the histograms dumped there on exit.
+"""
+
+import atexit
+import bisect
+import json
+import os
+import time
+
+
+class Histogram:
+    """
+    Latency histogram with power of two millisecond buckets.
+
+        >>> h = Histogram()
+        >>> for ms in (0.1, 0.3, 0.3, 3, 40):
+        ...     h.record(ms / 1000)
+        >>> h.count, round(h.mean * 1000, 2), h.percentile(50), h.percentile(99)
+        (5, 8.74, 0.5, 64)
+        >>> h.buckets()
+        [(0.125, 1), (0.5, 2), (4, 1), (64, 1)]
+    """
+    BOUNDS = [2**i for i in range(-3, 11)] # 0.125ms to 1024ms
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p):
+        """ Upper bound (in ms) of the bucket holding the p-th percentile """
+        if not self.count:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        for bound, count in zip(self.BOUNDS + [float('inf')], self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+
+    def buckets(self):
+        """ (upper bound in ms, count) for each non-empty bucket """
+        return [(bound, count)
+                for bound, count in zip(self.BOUNDS + [float('inf')], self.counts)
+                if count]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.mean * 1000 if self.count else None,
+            'min_ms': self.min * 1000 if self.count else None,
+            'max_ms': self.max * 1000 if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'buckets': self.buckets(),
+        }
+
+class LatencyTracker:
+    """
+    Records the latency from each raw input to every later stage.
+
+        >>> now = 0
+        >>> tracker = LatencyTracker(clock=lambda: now)
+        >>> now = 0.001
+        >>> tracker.event(0)
+        >>> now = 0.002
+        >>> tracker.action(0)
+        >>> now = 0.010
+        >>> tracker.mark('redraw')
+        >>> now = 0.015
+        >>> tracker.mark('present')
+
+        >>> {stage: h.max for stage, h in tracker.histograms().items()}
+        {'event': 0.001, 'action': 0.002, 'redraw': 0.01, 'present': 0.015}
+
+    Marking present also counts as the redraw for inputs that didn't have one
+        >>> tracker.action(0.015)
+        >>> tracker.mark('present')
+        >>> tracker.histograms()['redraw'].count, tracker.histograms()['present'].count
+        (2, 2)
+    """
+    STAGES = ('event', 'action', 'redraw', 'present')
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._histograms = {stage: Histogram() for stage in self.STAGES}
+        # Input timestamps waiting to reach redraw and present
+        self._pending = {'redraw': [], 'present': []}
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        """ A tracker dumping to $PYSWEEP_LATENCY_LOG, or None if unset """
+        path = environ.get('PYSWEEP_LATENCY_LOG')
+        if not path:
+            return None
+        tracker = cls()
+        tracker.dump_at_exit(path)
+        return tracker
+
+    def event(self, t0):
+        """ An input timestamped at t0 became an InputEvent """
+        self._histograms['event'].record(self.clock() - t0)
+
+    def action(self, t0):
+        """ An input timestamped at t0 produced an Action """
+        self._histograms['action'].record(self.clock() - t0)
+        self._pending['redraw'].append(t0)
+
+    def mark(self, stage):
+        """ Every pending input has now reached stage ('redraw' or 'present') """
+        now = self.clock()
+        if stage == 'present':
+            self.mark('redraw')
+        pending = self._pending[stage]
+        histogram = self._histograms[stage]
+        for t0 in pending:
+            histogram.record(now - t0)
+        if stage == 'redraw':
+            self._pending['present'].extend(pending)
+        pending.clear()
+
+    def histograms(self):
+        return dict(self._histograms)
+
+    def summary(self):
+        return {stage: h.summary() for stage, h in self._histograms.items()}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def dump_at_exit(self, path):
+        atexit.register(self.dump, path)
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,241 @@
+"""
+On-disk layout cache
+
+Building a Display measures, expands and places every box,
+and resizes the stretched border edges to fit.
+For the same skin and board size this always comes out the same,
+so the resolved layout (the size and offsets of every box,
+the resized edge images and so the Display's size) is saved to a file the first time,
+and later launches build the tree under box.deferred_layout and restore it instead.
+
+Files are keyed by a hash of the skin's images, the zoom,
+the board's rows and cols and the counters' sizes.
+"""
+
+import base64
+import hashlib
+import json
+import os
+
+from PIL import Image
+
+from .box import GridBox, UniformGridBox, deferred_layout
+from .display import Display, GridTile
+from .skin import Skin
+
+
+LAYOUT_VERSION = 1 # Bump whenever the layout code changes what it computes
+
+STRETCHED = (GridTile.PasteType.HorzFast, GridTile.PasteType.VertFast)
+
+""" Capturing and restoring """
+
+def layout_boxes(display):
+    """
+    Every box whose layout is saved, in walk order.
+    The cells of a UniformGridBox are left out, as it places them arithmetically anyway.
+    """
+    stack = [display]
+    while stack:
+        b = stack.pop()
+        yield b
+        if not isinstance(b, UniformGridBox):
+            stack.extend(reversed(tuple(b.children())))
+
+def shape(boxes):
+    """ A hash of the types of boxes (and the dimensions of uniform grids) """
+    names = ','.join(
+        f'{type(b).__name__}{len(b.rows)}x{len(b.rows[0])}' if isinstance(b, UniformGridBox)
+        else type(b).__name__
+        for b in boxes)
+    return hashlib.sha1(names.encode()).hexdigest()
+
+def capture_layout(display):
+    """ The resolved layout of display, as something json can save """
+    boxes = list(layout_boxes(display))
+    entries = []
+    images = {}
+    for i, b in enumerate(boxes):
+        entry = [b.minwidth, b.minheight, b.width, b.height,
+                 b.localoffset_x, b.localoffset_y, b.parentoffset_x, b.parentoffset_y]
+        if isinstance(b, GridBox):
+            entry += [b.colwidths, b.rowheights]
+        elif isinstance(b, UniformGridBox):
+            entry += [b.cellsize]
+        entries.append(entry)
+        if isinstance(b, GridTile) and b.pastetype in STRETCHED:
+            img = b.tileimg.convert('RGBA')
+            images[str(i)] = [img.size, base64.b64encode(img.tobytes()).decode('ascii')]
+    return {
+        'version': LAYOUT_VERSION,
+        'shape': shape(boxes),
+        'size': display.size,
+        'boxes': entries,
+        'images': images,
+    }
+
+def restore_layout(display, layout):
+    """
+    Puts a layout from capture_layout onto a display with the same parts,
+    which is usually built under deferred_layout.
+
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import DisplayImage
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> built = Display(DisplayImage(None), skin, boardrows=4, boardcols=5)
+        >>> with deferred_layout():
+        ...     restored = Display(DisplayImage(None), skin, boardrows=4, boardcols=5)
+        >>> restored.size
+        (0, 0)
+        >>> restore_layout(restored, capture_layout(built))
+        >>> restored.size == built.size
+        True
+        >>> all(a.boxcoords == b.boxcoords for a, b in zip(built.walk(), restored.walk()))
+        True
+
+    Both draw the same picture
+        >>> for d in (built, restored):
+        ...     d.image.pil_image = Image.new(size=d.size, mode="RGBA")
+        ...     d.draw()
+        >>> built.image.pil_image.tobytes() == restored.image.pil_image.tobytes()
+        True
+
+    Layouts of a different tree are refused
+        >>> restore_layout(Display(DisplayImage(None), skin, boardrows=3, boardcols=5), capture_layout(built))
+        Traceback (most recent call last):
+          ...
+        ValueError: Saved layout does not match the display's parts
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    boxes = list(layout_boxes(display))
+    if layout.get('version') != LAYOUT_VERSION or layout.get('shape') != shape(boxes):
+        raise ValueError("Saved layout does not match the display's parts")
+    images = layout['images']
+    for i, (b, entry) in enumerate(zip(boxes, layout['boxes'])):
+        (b.minwidth, b.minheight, b.width, b.height,
+         b.localoffset_x, b.localoffset_y, b.parentoffset_x, b.parentoffset_y) = entry[:8]
+        if isinstance(b, GridBox):
+            b.colwidths, b.rowheights = entry[8:]
+        elif isinstance(b, UniformGridBox):
+            b.cellsize = tuple(entry[8])
+            b._origin = None
+            b.update_child_offsets()
+        if str(i) in images:
+            size, data = images[str(i)]
+            b.tileimg = Image.frombytes('RGBA', tuple(size), base64.b64decode(data))
+
+""" The cache """
+
+class LayoutCache:
+    """
+    Layouts saved as json files in directory.
+
+        >>> import tempfile
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import DisplayImage
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> cache = LayoutCache(tempfile.mkdtemp())
+        >>> first = cache.display(DisplayImage(None), skin, boardrows=9, boardcols=9)
+        >>> cache.hits, cache.misses
+        (0, 1)
+        >>> second = cache.display(DisplayImage(None), skin, boardrows=9, boardcols=9)
+        >>> cache.hits, cache.misses
+        (1, 1)
+        >>> second.size == first.size
+        True
+        >>> [b.offset for b in second.walk()] == [b.offset for b in first.walk()]
+        True
+
+    Anything in the key changing is a different layout
+        >>> cache.key(skin, boardrows=9, boardcols=9) == cache.key(skin, boardrows=9, boardcols=10)
+        False
+        >>> cache.key(skin, boardrows=9, boardcols=9) == cache.key(skin, zoom=2, boardrows=9, boardcols=9)
+        False
+        >>> cache.key(skin) == cache.key(Skin(Dir('images')))
+        False
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    _skinhashes = {} # Map of (source, path, generation) to the hash of a skin's images
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def skin_hash(cls, skin):
+        """ A hash of the contents of every image in skin (at its native size) """
+        key = (skin._source, skin._path, skin.generation)
+        try:
+            return cls._skinhashes[key]
+        except KeyError:
+            h = hashlib.sha1()
+            native = Skin(skin._source, skin._path)
+            for path in Skin.FILES:
+                img = native.get(path).open()
+                h.update(f'{path}:{img.mode}:{img.size}:'.encode())
+                h.update(img.tobytes())
+            cls._skinhashes[key] = digest = h.hexdigest()
+            return digest
+
+    def key(self, skin, zoom=None, lcountersize=3, rcountersize=3, boardcols=30, boardrows=16):
+        if zoom is None:
+            zoom = skin.zoom
+        parts = [LAYOUT_VERSION, self.skin_hash(skin), zoom, boardrows, boardcols, lcountersize, rcountersize]
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'layout-{key}.json')
+
+    def load(self, key):
+        """ The saved layout for key, or None """
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, layout):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(layout, f)
+        os.replace(tmp, path) # So a reader never sees half a file
+
+    def display(self, image, skin, zoom=None, lcountersize=3, rcountersize=3, boardcols=30, boardrows=16):
+        """ Display(image, skin, ...), restoring its layout from the cache when there is one """
+        args = dict(zoom=zoom, lcountersize=lcountersize, rcountersize=rcountersize,
+                    boardcols=boardcols, boardrows=boardrows)
+        key = self.key(skin, **args)
+        layout = self.load(key)
+        if layout is not None:
+            with deferred_layout():
+                display = Display(image, skin, **args)
+            try:
+                restore_layout(display, layout)
+            except (ValueError, TypeError, KeyError):
+                pass # Stale or damaged, rebuilt below
+            else:
+                self.hits += 1
+                return display
+
+        self.misses += 1
+        display = Display(image, skin, **args)
+        try:
+            self.store(key, capture_layout(display))
+        except OSError:
+            pass # Only a cache
+        return display
+
+    @classmethod
+    def from_environ(cls):
+        """ A LayoutCache in the directory named by PYSWEEP_LAYOUTCACHE, or None """
+        directory = os.environ.get('PYSWEEP_LAYOUTCACHE')
+        if not directory:
+            return None
+        return cls(directory)
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,365 @@
+"""
+Minimap for boards bigger than the window
+
+A Minimap keeps a small image with one cell (of cell x cell pixels) per tile,
+coloured from a table with one colour per TileState made from the skin's tile images.
+Changes like the ones Game.act returns repaint only their own cells,
+and the viewport rectangle is drawn on top and moved by repainting only its perimeter,
+so an update costs O(changed cells) however big the board is.
+"""
+
+from PIL import Image, ImageChops, ImageStat
+
+from .display import TileState
+
+
+def tile_colours(skin):
+    """
+    One RGB colour per TileState code, from the tile images of skin (like skin.board.tile).
+
+    Most tiles look like an opened tile (or an unopened one) with something drawn on,
+    so they take the average colour of just what is drawn on,
+    which is the colour of the number, the mine or the flag.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Dir
+        >>> colours = tile_colours(Skin(Dir('images')).board.tile)
+        >>> len(colours) == len(TileState.STATES)
+        True
+        >>> len(set(colours[state.code] for state in TileState.Number[1:4]))
+        3
+        >>> colours[TileState.Flag.code] != colours[TileState.Unopened.code]
+        True
+    """
+    images = [skin[state.name].open().convert('RGB') for state in TileState.STATES]
+    opened = images[TileState.Number[0].code]
+    unopened = images[TileState.Unopened.code]
+    colours = []
+    for state, img in zip(TileState.STATES, images):
+        if state is TileState.Flag:
+            base = unopened
+        elif state in (TileState.Number[0], TileState.Unopened):
+            base = None
+        else:
+            base = opened
+        mask = None
+        if base is not None and base.size == img.size:
+            mask = ImageChops.difference(img, base).convert('L').point(lambda v: 255 if v else 0)
+            if not mask.getbbox():
+                mask = None
+        mean = ImageStat.Stat(img, mask).mean
+        colours.append(tuple(round(v) for v in mean))
+    return colours
+
+def merge_boxes(boxes, gap=0):
+    """
+    Merges boxes (x1, y1, x2, y2) that overlap or come within gap pixels of each other
+    into their bounding box, leaving boxes far from the rest on their own.
+
+        >>> merge_boxes([(0, 0, 2, 2), (2, 0, 4, 2), (100, 100, 102, 102)])
+        [(0, 0, 4, 2), (100, 100, 102, 102)]
+        >>> merge_boxes([(0, 0, 2, 2), (5, 0, 7, 2), (9, 0, 11, 2)], gap=3)
+        [(0, 0, 11, 2)]
+    """
+    merged = []
+    for x1, y1, x2, y2 in sorted(boxes):
+        i = 0
+        while i < len(merged):
+            mx1, my1, mx2, my2 = merged[i]
+            if mx1 - gap <= x2 and x1 <= mx2 + gap and my1 - gap <= y2 and y1 <= my2 + gap:
+                x1, y1, x2, y2 = min(x1, mx1), min(y1, my1), max(x2, mx2), max(y2, my2)
+                del merged[i]
+                i = 0 # The bigger box may reach ones it missed before
+            else:
+                i += 1
+        merged.append((x1, y1, x2, y2))
+    return merged
+
+class Minimap:
+    """
+    An overview of a board, one cell per tile.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Dir
+        >>> skin = Skin(Dir('images'))
+        >>> minimap = Minimap(100, 200, skin.board.tile, cell=2)
+        >>> minimap.image.size
+        (400, 200)
+        >>> colours = minimap.colours
+
+        >>> minimap.update([(3, 4, TileState.Number[1]), (99, 199, TileState.Flag)])
+        >>> minimap.image.getpixel((9, 7)) == colours[TileState.Number[1].code]
+        True
+        >>> minimap.take_dirty()
+        [(8, 6, 10, 8), (398, 198, 400, 200)]
+        >>> minimap.update([(7, 10, TileState.Number[2]), (5, 9, TileState.Flag)])
+        >>> minimap.take_dirty_box()
+        (18, 10, 22, 16)
+        >>> minimap.take_dirty_box() is None
+        True
+
+    The viewport is outlined, in tiles as (row1, col1, row2, col2)
+        >>> minimap.set_viewport(2, 3, 10, 20)
+        >>> minimap.image.getpixel((6, 4)) == minimap.outline
+        True
+        >>> minimap.image.getpixel((9, 7)) == colours[TileState.Number[1].code]
+        True
+
+    Cells under the outline keep it when they change
+        >>> minimap.update([(2, 5, TileState.Mine)])
+        >>> minimap.image.getpixel((10, 4)) == minimap.outline
+        True
+        >>> minimap.image.getpixel((10, 5)) == colours[TileState.Mine.code]
+        True
+
+    Moving the viewport only repaints the old and new perimeters
+        >>> _ = minimap.take_dirty()
+        >>> minimap.set_viewport(50, 100, 60, 110)
+        >>> len(minimap.take_dirty()) < 4 * (17 + 8) + 4 * (10 + 10)
+        True
+        >>> minimap.image.getpixel((6, 4)) == colours[TileState.Unopened.code]
+        True
+        >>> minimap.image.getpixel((10, 5)) == colours[TileState.Mine.code]
+        True
+
+    The same as painting the whole board from scratch
+        >>> fresh = Minimap(100, 200, skin.board.tile, cell=2)
+        >>> fresh.sync(minimap.grid())
+        >>> fresh.set_viewport(50, 100, 60, 110)
+        >>> fresh.image.tobytes() == minimap.image.tobytes()
+        True
+        >>> minimap.cell_at(9, 7)
+        (3, 4)
+
+    Like DisplayImage, past MAX_DIRTY repaints nobody took
+    the dirty boxes collapse into one covering the whole image
+        >>> minimap.repaint()
+        >>> minimap.dirty
+        [(0, 0, 400, 200)]
+        >>> minimap.take_dirty(), minimap.dirty
+        ([(0, 0, 400, 200)], [])
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    MAX_DIRTY = 512
+
+    _colourtables = {} # Map of (source, path, zoom, generation) of a tile skin to its tile_colours
+
+    def __init__(self, rows, cols, skin, cell=1, outline=(255, 0, 0)):
+        self.rows, self.cols = rows, cols
+        self.cell = cell
+        self.outline = outline
+        self.colours = self.load_colours(skin)
+        unopened = TileState.Unopened.code
+        self.codes = [bytearray([unopened]) * cols for i in range(rows)]
+        self.image = Image.new('RGB', (cols * cell, rows * cell), self.colours[unopened])
+        self.viewport = None
+        self.dirty = [] # Boxes (x1, y1, x2, y2) repainted since the last take_dirty
+        self._whole = False # Whether dirty has been collapsed to the whole image
+
+    @classmethod
+    def load_colours(cls, skin):
+        key = (skin._source, skin._path, skin.zoom, skin.generation)
+        try:
+            return cls._colourtables[key]
+        except KeyError:
+            table = cls._colourtables[key] = tile_colours(skin)
+            return table
+
+    def retarget(self, skin):
+        """ Switches to the colours of another skin, repainting everything """
+        self.colours = self.load_colours(skin)
+        self.repaint()
+
+    def grid(self):
+        """ The TileStates shown """
+        states = TileState.STATES
+        return [[states[code] for code in row] for row in self.codes]
+
+    def cell_box(self, row, col):
+        c = self.cell
+        return (col * c, row * c, (col + 1) * c, (row + 1) * c)
+
+    def cell_at(self, x, y):
+        """ (row, col) of the tile under the pixel x, y of the minimap, or None """
+        row, col = y // self.cell, x // self.cell
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return (row, col)
+        return None
+
+    def invalidate(self, box):
+        if self._whole:
+            return
+        if len(self.dirty) < self.MAX_DIRTY:
+            self.dirty.append(box)
+        else:
+            self.dirty = [(0, 0) + self.image.size]
+            self._whole = True
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, []
+        self._whole = False
+        return dirty
+
+    def take_dirty_box(self):
+        """ The bounding box of everything repainted since the last take, or None """
+        dirty = self.take_dirty()
+        if not dirty:
+            return None
+        x1s, y1s, x2s, y2s = zip(*dirty)
+        return (min(x1s), min(y1s), max(x2s), max(y2s))
+
+    """ Cells """
+
+    def update(self, changes):
+        """ Shows the (row, col, state) changes, such as the ones Game.act returns """
+        for row, col, state in changes:
+            self.codes[row][col] = state.code
+            self._paint(row, col)
+
+    def sync(self, tiles):
+        """ Shows every state of the grid tiles, repainting only the ones that differ """
+        for i, (row, codes) in enumerate(zip(tiles, self.codes)):
+            for j, state in enumerate(row):
+                if codes[j] != state.code:
+                    codes[j] = state.code
+                    self._paint(i, j)
+
+    def repaint(self):
+        for i in range(self.rows):
+            for j in range(self.cols):
+                self._paint(i, j)
+
+    def _paint(self, row, col):
+        box = self.cell_box(row, col)
+        self.image.paste(self.colours[self.codes[row][col]], box)
+        if self.viewport is not None and self._on_outline(row, col):
+            self._draw_outline(box)
+        self.invalidate(box)
+
+    def _on_outline(self, row, col):
+        row1, col1, row2, col2 = self.viewport
+        return ((row in (row1, row2 - 1) and col1 <= col < col2) or
+                (col in (col1, col2 - 1) and row1 <= row < row2))
+
+    """ Viewport """
+
+    def _outline_rects(self):
+        """ The four 1 pixel wide sides of the viewport rectangle """
+        row1, col1, row2, col2 = self.viewport
+        c = self.cell
+        x1, y1, x2, y2 = col1 * c, row1 * c, col2 * c, row2 * c
+        return [(x1, y1, x2, y1 + 1), (x1, y2 - 1, x2, y2),
+                (x1, y1, x1 + 1, y2), (x2 - 1, y1, x2, y2)]
+
+    def _draw_outline(self, clip):
+        """ Draws the parts of the outline inside the box clip """
+        cx1, cy1, cx2, cy2 = clip
+        for x1, y1, x2, y2 in self._outline_rects():
+            box = (max(x1, cx1), max(y1, cy1), min(x2, cx2), min(y2, cy2))
+            if box[0] < box[2] and box[1] < box[3]:
+                self.image.paste(self.outline, box)
+
+    def _perimeter(self):
+        """ Every (row, col) the outline passes through """
+        row1, col1, row2, col2 = self.viewport
+        cells = set()
+        for j in range(col1, col2):
+            cells.add((row1, j))
+            cells.add((row2 - 1, j))
+        for i in range(row1, row2):
+            cells.add((i, col1))
+            cells.add((i, col2 - 1))
+        return cells
+
+    def set_viewport(self, row1, col1, row2, col2):
+        """ Outlines the tiles in rows row1 to row2 and cols col1 to col2 (both exclusive) """
+        old = self._perimeter() if self.viewport is not None else set()
+        self.viewport = None
+        for row, col in old:
+            self._paint(row, col)
+
+        row1, row2 = max(0, row1), min(self.rows, row2)
+        col1, col2 = max(0, col1), min(self.cols, col2)
+        if row1 >= row2 or col1 >= col2:
+            return
+        self.viewport = (row1, col1, row2, col2)
+        for row, col in self._perimeter():
+            box = self.cell_box(row, col)
+            self._draw_outline(box)
+            self.invalidate(box)
+
+    def set_viewport_pixels(self, display, x1, y1, x2, y2):
+        """
+        Outlines the tiles visible in the region (x1, y1, x2, y2) of display,
+        such as the part of it scrolled into view.
+
+            >>> from .skin import Skin
+            >>> from .dirstruct import Dir
+            >>> from .display import Display, DisplayImage
+            >>> skin = Skin(Dir('images'))
+            >>> display = Display(DisplayImage(None), skin, boardrows=50, boardcols=50)
+            >>> minimap = Minimap(50, 50, skin.board.tile)
+            >>> x, y = display.tiles[10][20].offset
+            >>> minimap.set_viewport_pixels(display, x, y, x + 16 * 5 + 1, y + 16 * 3)
+            >>> minimap.viewport
+            (10, 20, 13, 26)
+            >>> skin.cache = {} # Clean up for the sake of other tests
+        """
+        tiles = display.tiles
+        tx, ty = tiles[0][0].offset
+        w, h = tiles[0][0].size
+        self.set_viewport((y1 - ty) // h, (x1 - tx) // w, -(-(y2 - ty) // h), -(-(x2 - tx) // w))
+
+try: # pragma: no cover
+    import tkinter
+    from PIL import ImageTk
+
+    MERGE_GAP = 8 # Pixels between boxes that are still uploaded together
+    MAX_COPIES = 32 # Past this many boxes, or FULL_PASTE of the image, one paste of the whole image is cheaper
+    FULL_PASTE = 0.5
+
+    def upload_boxes(photo, image, boxes):
+        """ Uploads the boxes of image to the ImageTk.PhotoImage photo, merging nearby ones """
+        boxes = merge_boxes(boxes, MERGE_GAP)
+        if not boxes:
+            return
+        width, height = image.size
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes)
+        if len(boxes) > MAX_COPIES or area > FULL_PASTE * width * height:
+            photo.paste(image)
+            return
+        # ImageTk only pastes whole photos, so stage each box in one and let Tk copy it across
+        for box in boxes:
+            patch = ImageTk.PhotoImage(image.crop(box))
+            photo.tk.call(str(photo), 'copy', str(patch), '-to', box[0], box[1])
+
+    class MinimapCanvas(tkinter.Canvas):
+        """
+        Shows a Minimap, and calls on_select(row, col) when it is clicked,
+        to move the main view there.
+        """
+        def __init__(self, master, minimap, on_select=None):
+            self.master = master
+            self.minimap = minimap
+            self.on_select = on_select
+            width, height = minimap.image.size
+            super().__init__(self.master, width=width, height=height, highlightthickness=0)
+            self.tkimg = ImageTk.PhotoImage(minimap.image)
+            self.imageitem = self.create_image(0, 0, image=self.tkimg, anchor='nw')
+            self.bind('<ButtonPress-1>', self.select)
+            self.bind('<B1-Motion>', self.select)
+
+        def select(self, e):
+            cell = self.minimap.cell_at(e.x, e.y)
+            if cell is not None and self.on_select is not None:
+                self.on_select(*cell)
+
+        def draw(self):
+            """ Uploads what was repainted """
+            upload_boxes(self.tkimg, self.minimap.image, self.minimap.take_dirty())
+except ImportError: # pragma: no cover
+    pass
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,224 @@
+"""
+Frame patch encoding
+
+Nearly every change to a minesweeper display is a sprite (tile, digit or face)
+switching to another image from the skin.
+PatchEncoder knows every sprite image, so a changed rectangle
+that matches one of them is sent as a 7 byte reference,
+and anything else falls back to deflated pixels.
+
+Stream format, a frame is just its patches one after the other:
+
+    B        kind
+    IMAGE    >HHH    x, y, image id
+    PIXELS   >HHHHI  x, y, width, height, data length, then zlib compressed RGBA pixels
+
+Both ends build the same image table from the same skin (PatchEncoder.for_display),
+or the decoder can be sent the encoder's table_bytes.
+"""
+
+import functools
+import struct
+import zlib
+
+from PIL import Image, ImageChops
+
+
+IMAGE = 1
+PIXELS = 2
+
+KIND = struct.Struct('>B')
+IMAGE_PATCH = struct.Struct('>HHH')
+PIXELS_PATCH = struct.Struct('>HHHHI')
+TABLE_ENTRY = struct.Struct('>HHI')
+
+def sprite_tables(display):
+    """ The image tables of every sprite family in display """
+    return [display.tiles[0][0].table,
+            display.face.table,
+            display.lcounter.digits[0].table,
+            display.rcounter.digits[0].table]
+
+class PatchEncoder:
+    """
+    Encodes changed rectangles of successive frames.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage, TileState
+
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> displayimg = DisplayImage(None)
+        >>> display = Display(displayimg, skin, boardcols=8, boardrows=8)
+        >>> displayimg.pil_image = Image.new(size=display.size, mode="RGBA")
+        >>> display.draw()
+        >>> encoder = PatchEncoder.for_display(display)
+        >>> decoder = PatchDecoder(encoder.images, display.size)
+
+    The first frame is sent as pixels
+        >>> first = encoder.encode(displayimg.pil_image, [(0, 0) + display.size])
+        >>> decoder.apply(first)
+        1
+
+    A tile change is a single image reference
+        >>> _ = displayimg.take_dirty()
+        >>> display.tiles[2][3].state = TileState.Number[3]
+        >>> display.tiles[2][3].draw()
+        >>> data = encoder.encode(displayimg.pil_image, displayimg.take_dirty())
+        >>> len(data)
+        7
+        >>> decoder.apply(data)
+        1
+        >>> decoder.frame.tobytes() == displayimg.pil_image.tobytes()
+        True
+
+    Without dirty rectangles, frames are compared on the tile grid
+        >>> previous = displayimg.pil_image.copy()
+        >>> for j in range(8):
+        ...     display.tiles[5][j].state = TileState.Flag
+        ...     display.tiles[5][j].draw()
+        >>> data = encoder.encode_diff(previous, displayimg.pil_image)
+        >>> len(data), decoder.apply(data)
+        (56, 8)
+        >>> decoder.frame.tobytes() == displayimg.pil_image.tobytes()
+        True
+        >>> encoder.stats
+        {'image': 9, 'pixels': 1, 'bytes': ...}
+
+    The table can be shipped to decoders that don't have the skin
+        >>> PatchDecoder.from_table_bytes(encoder.table_bytes(), display.size).images == decoder.images
+        True
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    _encoders = {} # Map of ids of sprite tables to a shared PatchEncoder
+
+    def __init__(self, images, grid=None):
+        self.images = [img.convert('RGBA') for img in images]
+        # Map of (size, pixels) to image id
+        self.ids = {}
+        for i, img in enumerate(self.images):
+            self.ids.setdefault((img.size, img.tobytes()), i)
+        # (origin x, origin y, cell width, cell height) used by encode_diff
+        self.grid = grid
+        self.stats = {'image': 0, 'pixels': 0, 'bytes': 0}
+
+    @classmethod
+    def for_display(cls, display):
+        """
+        An encoder knowing every sprite image of display,
+        shared between displays using the same skin.
+        The tile grid is used to line up encode_diff's comparisons.
+        """
+        tables = sprite_tables(display)
+        tile = display.tiles[0][0]
+        key = (tuple(id(t) for t in tables), tile.offset)
+        try:
+            return cls._encoders[key]
+        except KeyError:
+            images = []
+            for table in tables:
+                images.extend(table)
+            encoder = cls._encoders[key] = cls(images, grid=tile.offset + tile.size)
+            return encoder
+
+    def encode(self, img, rects):
+        """ Encodes the given rectangles (x1, y1, x2, y2) of img """
+        chunks = []
+        for rect in dict.fromkeys(rects): # Drop repeats, keep order
+            x1, y1, x2, y2 = rect
+            region = img.crop(rect)
+            i = self.ids.get((region.size, region.tobytes()))
+            if i is not None:
+                chunks.append(KIND.pack(IMAGE) + IMAGE_PATCH.pack(x1, y1, i))
+                self.stats['image'] += 1
+            else:
+                data = zlib.compress(region.tobytes())
+                chunks.append(KIND.pack(PIXELS) + PIXELS_PATCH.pack(x1, y1, x2-x1, y2-y1, len(data)))
+                chunks.append(data)
+                self.stats['pixels'] += 1
+        data = b''.join(chunks)
+        self.stats['bytes'] += len(data)
+        return data
+
+    def changed_rects(self, previous, img):
+        """ Rectangles of img that differ from previous, in grid cells where possible """
+        # Nonzero wherever any band differs
+        diff = functools.reduce(ImageChops.lighter, ImageChops.difference(previous, img).split())
+        bbox = diff.getbbox()
+        if bbox is None:
+            return []
+        if self.grid is None:
+            return [bbox]
+
+        ox, oy, w, h = self.grid
+        width, height = img.size
+        rects = []
+        # Cells of the grid, plus whatever is left over around it
+        xs = sorted({0, width} | set(range(ox % w, width, w)))
+        ys = sorted({0, height} | set(range(oy % h, height, h)))
+        for y1, y2 in zip(ys, ys[1:]):
+            if y2 <= bbox[1] or y1 >= bbox[3]:
+                continue
+            for x1, x2 in zip(xs, xs[1:]):
+                if x2 <= bbox[0] or x1 >= bbox[2]:
+                    continue
+                if diff.crop((x1, y1, x2, y2)).getbbox() is not None:
+                    rects.append((x1, y1, x2, y2))
+        return rects
+
+    def encode_diff(self, previous, img):
+        """ Encodes everything that changed between two frames """
+        return self.encode(img, self.changed_rects(previous, img))
+
+    def table_bytes(self):
+        chunks = []
+        for img in self.images:
+            data = zlib.compress(img.tobytes())
+            chunks.append(TABLE_ENTRY.pack(img.size[0], img.size[1], len(data)))
+            chunks.append(data)
+        return b''.join(chunks)
+
+class PatchDecoder:
+    """
+    Rebuilds frames from a patch stream.
+    """
+    def __init__(self, images, size):
+        self.images = [img.convert('RGBA') for img in images]
+        self.frame = Image.new('RGBA', size)
+
+    @classmethod
+    def from_table_bytes(cls, data, size):
+        images = []
+        pos = 0
+        while pos < len(data):
+            w, h, length = TABLE_ENTRY.unpack_from(data, pos)
+            pos += TABLE_ENTRY.size
+            images.append(Image.frombytes('RGBA', (w, h), zlib.decompress(data[pos:pos+length])))
+            pos += length
+        return cls(images, size)
+
+    def apply(self, data):
+        """ Applies every patch in data to frame, returns the number of patches """
+        n = 0
+        pos = 0
+        while pos < len(data):
+            kind, = KIND.unpack_from(data, pos)
+            pos += KIND.size
+            if kind == IMAGE:
+                x, y, i = IMAGE_PATCH.unpack_from(data, pos)
+                pos += IMAGE_PATCH.size
+                self.frame.paste(self.images[i], (x, y))
+            elif kind == PIXELS:
+                x, y, w, h, length = PIXELS_PATCH.unpack_from(data, pos)
+                pos += PIXELS_PATCH.size
+                pixels = zlib.decompress(data[pos:pos+length])
+                pos += length
+                self.frame.paste(Image.frombytes('RGBA', (w, h), pixels), (x, y))
+            else:
+                raise ValueError(f'Unknown patch kind {kind}')
+            n += 1
+        return n
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,246 @@
+"""
+Headless bot playouts
+
+Plays games with the Game engine alone (no Display) to measure how often
+solving strategies win.
+A strategy is a function strategy(game, rng) returning the next
+(action, row, col) to play, looking only at game.tiles (what a player can see).
+
+Game i of a run is played from seed base + i, for both the board and the strategy's rng,
+so any single game can be played again exactly with replay.
+
+Run standalone:
+
+    python -m pysweep.playout --strategy simple --games 100000 --processes 4
+
+Results are streamed as one JSON line per finished batch,
+followed by a summary with the win rate and games per second per core.
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+import weakref
+
+from .display import TileState
+from .game import Game
+from .probability import ProbabilitySolver
+
+
+""" Strategies """
+
+def unopened(game):
+    return [(i, j) for i in range(game.rows) for j in range(game.cols)
+            if game.tiles[i][j] is TileState.Unopened]
+
+def random_strategy(game, rng):
+    """ Opens a random unopened tile """
+    return ('open',) + rng.choice(unopened(game))
+
+def simple_strategy(game, rng):
+    """
+    Flags the neighbours of a number that must all be mines,
+    opens the neighbours of a number whose mines are all flagged,
+    and guesses at random when neither applies.
+    """
+    if game.status == 'ready':
+        return ('open', game.rows // 2, game.cols // 2)
+    tiles = game.tiles
+    for i in range(game.rows):
+        for j in range(game.cols):
+            n = getattr(tiles[i][j], 'n', 0)
+            if n == 0:
+                continue
+            hidden = []
+            flags = 0
+            for a, b in game.neighbours(i, j):
+                state = tiles[a][b]
+                if state is TileState.Unopened:
+                    hidden.append((a, b))
+                elif state is TileState.Flag:
+                    flags += 1
+            if not hidden:
+                continue
+            if flags == n:
+                return ('open',) + hidden[0]
+            if flags + len(hidden) == n:
+                return ('flag',) + hidden[0]
+    return random_strategy(game, rng)
+
+_solvers = weakref.WeakKeyDictionary() # Map of Game to the ProbabilitySolver playing it
+
+def probability_strategy(game, rng):
+    """
+    Flags certain mines, otherwise opens the tile least likely to be a mine.
+    Each game keeps one solver, so components untouched by a move aren't enumerated again.
+
+        >>> game = Game(9, 9, 10, 5)
+        >>> rng = random.Random(5)
+        >>> _ = game.act(*probability_strategy(game, rng))
+        >>> solver, reused = None, 0
+        >>> for i in range(12):
+        ...     if not game.finished:
+        ...         _ = game.act(*probability_strategy(game, rng))
+        ...         solver = solver or _solvers[game]
+        ...         reused += _solvers[game].reused
+        >>> _solvers[game] is solver, reused > 0
+        (True, True)
+    """
+    if game.status == 'ready':
+        return ('open', game.rows // 2, game.cols // 2)
+    try:
+        solver = _solvers[game]
+    except KeyError:
+        solver = _solvers[game] = ProbabilitySolver(game.mines)
+    probs = solver.solve(game.tiles)
+    best, choices = 2, []
+    for i, row in enumerate(probs):
+        for j, p in enumerate(row):
+            if p is None or game.tiles[i][j] is not TileState.Unopened:
+                continue
+            if p == 1:
+                return ('flag', i, j)
+            if p < best:
+                best, choices = p, [(i, j)]
+            elif p == best:
+                choices.append((i, j))
+    if not choices:
+        return simple_strategy(game, rng) # Every hidden tile is in a component too big to solve
+    return ('open',) + rng.choice(choices)
+
+STRATEGIES = {
+    'random': random_strategy,
+    'simple': simple_strategy,
+    'probability': probability_strategy,
+}
+
+""" Playing """
+
+def play(strategy, rows, cols, mines, seed, log=None):
+    """
+    Plays one game to the end, returns (won, moves).
+
+        >>> play(simple_strategy, 9, 9, 10, seed=5) == play(simple_strategy, 9, 9, 10, seed=5)
+        True
+    """
+    game = Game(rows, cols, mines, seed)
+    rng = random.Random(f'strategy-{seed}')
+    moves = 0
+    limit = rows * cols * 2 # Strategies that stop making progress still end
+    while not game.finished and moves < limit:
+        action = strategy(game, rng)
+        game.act(*action)
+        moves += 1
+        if log is not None:
+            log(action, game)
+    return game.status == 'won', moves
+
+def replay(strategy, rows, cols, mines, seed):
+    """
+    Plays one game again, returns the Game and the actions played.
+
+        >>> game, actions = replay(simple_strategy, 9, 9, 10, seed=5)
+        >>> game.finished, actions[0]
+        (True, ('open', 4, 4))
+    """
+    actions = []
+    final = []
+    def log(action, game):
+        actions.append(action)
+        final[:] = [game]
+    play(strategy, rows, cols, mines, seed, log)
+    return final[0], actions
+
+def play_batch(name, rows, cols, mines, seeds):
+    """ Plays every seed in seeds in a tight loop, returns the aggregated results """
+    strategy = STRATEGIES[name]
+    wins = moves = 0
+    start = time.process_time()
+    for seed in seeds:
+        won, n = play(strategy, rows, cols, mines, seed)
+        wins += won
+        moves += n
+    return {
+        'games': len(seeds),
+        'wins': wins,
+        'moves': moves,
+        'cpu_seconds': time.process_time() - start,
+        'seeds': [seeds.start, seeds.stop],
+    }
+
+def _play_batch(args):
+    return play_batch(*args)
+
+def run(name, rows, cols, mines, games, processes=None, batch=1000, base=0):
+    """
+    Plays games, yielding the results of each batch as it finishes.
+
+        >>> results = list(run('simple', 9, 9, 10, games=20, processes=1, batch=8))
+        >>> [r['games'] for r in results]
+        [8, 8, 4]
+        >>> summary = summarize(results, wall_seconds=1.0, processes=1)
+        >>> summary['games'], 0 <= summary['win_rate'] <= 1
+        (20, True)
+    """
+    tasks = [(name, rows, cols, mines, range(base + start, base + min(start + batch, games)))
+             for start in range(0, games, batch)]
+    if processes == 1:
+        for task in tasks:
+            yield _play_batch(task)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_play_batch, tasks)
+
+def summarize(results, wall_seconds, processes):
+    games = sum(r['games'] for r in results)
+    wins = sum(r['wins'] for r in results)
+    cpu = sum(r['cpu_seconds'] for r in results)
+    return {
+        'games': games,
+        'wins': wins,
+        'win_rate': wins / games if games else None,
+        'moves_per_game': sum(r['moves'] for r in results) / games if games else None,
+        'games_per_second': games / wall_seconds if wall_seconds else None,
+        'games_per_second_per_core': games / cpu if cpu else None,
+        'processes': processes,
+    }
+
+def main(argv=None): # pragma: no cover
+    parser = argparse.ArgumentParser(description='PySweeper bot playouts')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='simple')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--cols', type=int, default=30)
+    parser.add_argument('--mines', type=int, default=99)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--replay', type=int, metavar='SEED', help='play the game with this seed and print it')
+    args = parser.parse_args(argv)
+    strategy = STRATEGIES[args.strategy]
+
+    if args.replay is not None:
+        game, actions = replay(strategy, args.rows, args.cols, args.mines, args.replay)
+        for action in actions:
+            print(*action)
+        print(game)
+        print(game.status)
+        return
+
+    processes = args.processes or multiprocessing.cpu_count()
+    results = []
+    start = time.perf_counter()
+    for result in run(args.strategy, args.rows, args.cols, args.mines, args.games,
+                      processes, args.batch, args.seed):
+        results.append(result)
+        print(json.dumps(result), flush=True)
+    summary = summarize(results, time.perf_counter() - start, processes)
+    print(json.dumps(summary), flush=True)
+    print(f'''{summary['games_per_second_per_core']:.1f} games/s per core, '''
+          f'''win rate {summary['win_rate']:.4f}''', file=sys.stderr)
+
+if __name__ == "__main__": # pragma: no cover
+    main()
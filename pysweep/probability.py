@@ -0,0 +1,571 @@
+"""
+Exact mine probabilities for the unopened tiles of a board.
+
+The board is read as a grid of TileState classes (the same ones the Display uses),
+so it can be fed straight from Display.tiles.
+
+The frontier (unopened tiles next to a number) is split into components
+that share no constraints with each other.
+Each component's configurations are counted on their own,
+grouped by how many mines they use,
+and then weighted by the number of ways to place the remaining mines
+in the interior (unopened tiles not next to any number).
+
+Counting a component can take time exponential in its size,
+so components taking more than ProbabilitySolver.MAX_WORK to count are given up on:
+their tiles get no probability (None), and only bounds on the mines they hold
+are used to weight everything else, which is then approximate.
+"""
+
+import itertools
+import time
+from collections import deque
+
+from PIL import Image
+
+from .box import Box
+from .display import TileState
+
+
+def binomial(n, k):
+    """
+    n choose k, zero outside the usual range.
+
+        >>> binomial(5, 2), binomial(5, 0), binomial(5, 6), binomial(5, -1)
+        (10, 1, 0, 0)
+    """
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+def convolve(a, b):
+    """ Multiply two {mines: count} distributions """
+    result = {}
+    for ka, ca in a.items():
+        for kb, cb in b.items():
+            result[ka+kb] = result.get(ka+kb, 0) + ca*cb
+    return result
+
+class ComponentResult:
+    """
+    Configuration counts for a single frontier component.
+
+    counts[k] is the number of valid configurations using k mines,
+    cellcounts[k][i] is how many of those have a mine on cells[i].
+    An estimated result has cellcounts None, see estimate_component.
+    """
+    def __init__(self, cells, counts, cellcounts):
+        self.cells = cells
+        self.counts = counts
+        self.cellcounts = cellcounts
+
+def estimate_component(cells, constraints):
+    """
+    Stands in for enumerate_component on components too big to enumerate.
+    Only the bounds the constraints put on its number of mines are kept:
+    at least as many as the biggest constraint, at most their total,
+    with the cells otherwise taken as unconstrained.
+    The true number of mines is always inside the bounds,
+    so a board that can be satisfied still can be.
+
+        >>> a, b, c = (0, 0), (0, 1), (0, 2)
+        >>> r = estimate_component([a, b, c], [(frozenset([a, b]), 1), (frozenset([b, c]), 1)])
+        >>> r.counts, r.cellcounts
+        ({1: 3, 2: 3}, None)
+    """
+    cells = list(cells)
+    least = max(value for group, value in constraints)
+    most = min(len(cells), sum(value for group, value in constraints))
+    return ComponentResult(cells, {k: binomial(len(cells), k) for k in range(least, most + 1)}, None)
+
+def enumerate_component(cells, constraints, limit=None):
+    """
+    Counts every mine configuration of cells that satisfies constraints.
+
+    constraints is a list of (frozenset of cells, number of mines).
+    Cells in exactly the same constraints are interchangeable,
+    so they are taken as one group, and each number of mines in the group
+    counts as binomial(size, mines) configurations rather than being branched on cell by cell.
+    Groups are decided in order, and how the rest can be decided only depends on
+    the mines still to be placed in the constraints that are partly decided,
+    so each of those is only counted once.
+
+    Returns None instead if counting takes more than limit units of work
+    (about one per number added up, each well under a microsecond).
+
+        >>> a, b, c = (0, 0), (0, 1), (0, 2)
+        >>> r = enumerate_component([a, b, c], [(frozenset([a, b]), 1), (frozenset([b, c]), 1)])
+        >>> r.counts
+        {1: 1, 2: 1}
+        >>> r.cellcounts
+        {1: [0, 1, 0], 2: [1, 0, 1]}
+
+    A long edge of cells under the same constraints is a single group
+        >>> edge = [(0, j) for j in range(60)]
+        >>> r = enumerate_component(edge, [(frozenset(edge), 3)], limit=10)
+        >>> r.counts, r.cellcounts[3][0]
+        ({3: 34220}, 1711)
+
+    A long chain of constraints takes work in proportion to its length
+        >>> chain = [(0, j) for j in range(200)]
+        >>> r = enumerate_component(chain, [(frozenset(chain[j:j+3]), 1) for j in range(198)], limit=4000)
+        >>> r.counts
+        {66: 1, 67: 2}
+        >>> enumerate_component(chain, [(frozenset(chain[j:j+3]), 1) for j in range(198)], limit=1000) is None
+        True
+    """
+    cells = list(cells)
+
+    # Group cells by the constraints they take part in, keeping the order of cells
+    membership = {cell: [] for cell in cells}
+    for ci, (group, value) in enumerate(constraints):
+        for cell in group:
+            membership[cell].append(ci)
+    groups = {} # Map of tuple of constraint indices to the indices of its cells
+    for i, cell in enumerate(cells):
+        groups.setdefault(tuple(membership[cell]), []).append(i)
+    groupconstraints = list(groups)
+    groupcells = list(groups.values())
+    sizes = [len(members) for members in groupcells]
+    n = len(groupcells)
+
+    # active[g] are the constraints with groups both before g and from g on
+    first, last = {}, {}
+    for g, cis in enumerate(groupconstraints):
+        for ci in cis:
+            first.setdefault(ci, g)
+            last[ci] = g
+    opening = [[] for g in range(n + 2)]
+    closing = [[] for g in range(n + 2)]
+    for ci in first:
+        opening[first[ci] + 1].append(ci)
+        closing[last[ci] + 1].append(ci)
+    active = []
+    live = {} # The constraints active at g, in order
+    for g in range(n + 1):
+        live.update(dict.fromkeys(opening[g]))
+        for ci in closing[g]:
+            del live[ci]
+        active.append(list(live))
+
+    remaining = [value for group, value in constraints] # Mines still to be placed for each constraint
+    unassigned = [len(group) for group, value in constraints] # Cells still to be decided for each constraint
+    inside = {} # Map of (g, remaining of active[g]) to {mines: ways} of deciding groups g onwards
+    edges = {} # Map of the same keys to [(mines in group g, ways for group g, key after g)]
+    work = 0
+
+    class TooMuchWork(Exception):
+        pass
+
+    def spend(amount):
+        nonlocal work
+        work += amount
+        if limit is not None and work > limit:
+            raise TooMuchWork()
+
+    def count(g):
+        """ Fills in inside and edges for groups g onwards, given remaining. Returns the key """
+        spend(len(active[g]) + 1)
+        key = (g, tuple([remaining[ci] for ci in active[g]]))
+        if key in inside:
+            return key
+        if g == n:
+            inside[key] = {0: 1}
+            edges[key] = []
+            return key
+
+        result = {}
+        out = []
+        size = sizes[g]
+        cis = groupconstraints[g]
+        for ci in cis:
+            unassigned[ci] -= size
+        # The fewest mines that leave every constraint of the group enough cells for the rest,
+        # and the most every one of them has room for
+        least = max([0] + [remaining[ci] - unassigned[ci] for ci in cis])
+        most = min([size] + [remaining[ci] for ci in cis])
+        for m in range(least, most + 1):
+            for ci in cis:
+                remaining[ci] -= m
+            child = count(g+1)
+            for ci in cis:
+                remaining[ci] += m
+            rest = inside[child]
+            if not rest:
+                continue
+            spend(len(rest))
+            ways = binomial(size, m)
+            out.append((m, ways, child))
+            for k, w in rest.items():
+                result[m + k] = result.get(m + k, 0) + ways * w
+        for ci in cis:
+            unassigned[ci] += size
+        inside[key] = result
+        edges[key] = out
+        return key
+
+    # Then go forwards, with outside the {mines: ways} of deciding the groups before a key,
+    # so a group's cells have a mine in (outside) * (ways with m mines) * m / size * (inside after it)
+    try:
+        root = count(0)
+        counts = inside[root]
+        groupcounts = [{} for g in range(n)] # groupcounts[g][k] is per cell of group g, for k mines in all
+        level = {root: {0: 1}}
+        for g in range(n):
+            # First add up the ways into each child by each number of mines in group g
+            incoming = {} # Map of (child, m) to {mines: ways} of deciding groups up to g
+            for key, outside in level.items():
+                for m, ways, child in edges[key]:
+                    spend(len(outside))
+                    into = incoming.setdefault((child, m), {})
+                    for ko, wo in outside.items():
+                        into[ko + m] = into.get(ko + m, 0) + wo * ways
+            nextlevel = {}
+            gc = groupcounts[g]
+            for (child, m), into in incoming.items():
+                after = nextlevel.setdefault(child, {})
+                for k, w in into.items():
+                    after[k] = after.get(k, 0) + w
+                if m:
+                    rest = inside[child]
+                    spend(len(into) * len(rest))
+                    for k, w in into.items():
+                        # binomial(size-1, m-1) of the binomial(size, m) ways put a mine on any one cell
+                        w = w * m // sizes[g]
+                        for ki, wi in rest.items():
+                            gc[k + ki] = gc.get(k + ki, 0) + w * wi
+            level = nextlevel
+    except TooMuchWork:
+        return None
+
+    counts = dict(sorted(counts.items()))
+    cellcounts = {}
+    for k in counts:
+        cc = cellcounts[k] = [0] * len(cells)
+        for members, gc in zip(groupcells, groupcounts):
+            c = gc.get(k, 0)
+            for i in members:
+                cc[i] = c
+    return ComponentResult(cells, counts, cellcounts)
+
+class ProbabilitySolver:
+    """
+    Computes the exact probability that each unopened tile is a mine.
+
+    Component results are kept between calls to solve,
+    so only components whose constraints changed are enumerated again.
+    Components taking more than MAX_WORK to count are estimated instead.
+
+        >>> U, N = TileState.Unopened, TileState.Number
+        >>> solver = ProbabilitySolver(mines=1)
+        >>> solver.solve([[N[1], U, U]])
+        [[None, 1.0, 0.0]]
+
+    Interior tiles share the mines left over from the frontier
+        >>> solver = ProbabilitySolver(mines=2)
+        >>> probs = solver.solve([[N[1], U, U, U],
+        ...                       [U,    U, U, U]])
+        >>> [[round(p, 4) if p is not None else None for p in row] for row in probs]
+        [[None, 0.3333, 0.25, 0.25], [0.3333, 0.3333, 0.25, 0.25]]
+        >>> solver.enumerated, solver.reused
+        (1, 0)
+
+    Solving the same board again reuses the component
+        >>> probs = solver.solve([[N[1], U, U, U],
+        ...                       [U,    U, U, U]])
+        >>> solver.enumerated, solver.reused
+        (0, 1)
+
+    A board that cannot be satisfied raises ValueError
+        >>> ProbabilitySolver(mines=0).solve([[N[1], U]])
+        Traceback (most recent call last):
+          ...
+        ValueError: No mine configuration is consistent with the board
+
+    Components that are too big leave their tiles unknown
+        >>> solver = ProbabilitySolver(mines=2)
+        >>> solver.MAX_WORK = 2
+        >>> probs = solver.solve([[N[1], U, U, U],
+        ...                       [U,    U, U, U]])
+        >>> [[round(p, 4) if p is not None else None for p in row] for row in probs]
+        [[None, None, 0.25, 0.25], [None, None, 0.25, 0.25]]
+        >>> solver.enumerated, solver.estimated
+        (0, 1)
+    """
+    MAX_WORK = 20000 # See enumerate_component, about 10ms, so an expert board solves within a frame
+
+    _neighbourtables = {} # Map of (rows, cols) to neighbour_table
+
+    KNOWN_MINES = (TileState.Mine, TileState.Blast)
+    UNKNOWN = (TileState.Unopened, TileState.Flag)
+
+    def __init__(self, mines):
+        self.mines = mines
+        self._cache = {} # Map of frozenset of constraints to ComponentResult
+        self.enumerated = 0
+        self.reused = 0
+        self.estimated = 0
+
+    def neighbours(self, rows, cols, row, col):
+        for i in range(max(row-1, 0), min(row+2, rows)):
+            for j in range(max(col-1, 0), min(col+2, cols)):
+                if (i, j) != (row, col):
+                    yield (i, j)
+
+    @classmethod
+    def neighbour_table(cls, rows, cols):
+        """ The neighbours of every cell of a rows x cols board, as table[row][col] """
+        key = (rows, cols)
+        try:
+            return cls._neighbourtables[key]
+        except KeyError:
+            table = cls._neighbourtables[key] = [
+                [tuple(cls.neighbours(None, rows, cols, i, j)) for j in range(cols)] for i in range(rows)]
+            return table
+
+    def constraints(self, tiles):
+        """ Returns (constraints, unknown cells, number of known mines) """
+        rows, cols = len(tiles), len(tiles[0])
+        table = self.neighbour_table(rows, cols)
+
+        unknown = set()
+        knownmines = 0
+        for i, row in enumerate(tiles):
+            for j, state in enumerate(row):
+                if state in self.UNKNOWN:
+                    unknown.add((i, j))
+                elif state in self.KNOWN_MINES:
+                    knownmines += 1
+
+        constraints = []
+        for i, row in enumerate(tiles):
+            for j, state in enumerate(row):
+                n = getattr(state, 'n', None)
+                if n is None:
+                    continue
+                group = []
+                for cell in table[i][j]:
+                    if cell in unknown:
+                        group.append(cell)
+                    elif tiles[cell[0]][cell[1]] in self.KNOWN_MINES:
+                        n -= 1
+                if n < 0 or n > len(group):
+                    raise ValueError('No mine configuration is consistent with the board')
+                if group:
+                    constraints.append((frozenset(group), n))
+
+        return constraints, unknown, knownmines
+
+    def components(self, constraints):
+        """ Splits constraints into groups that share no cells """
+        parent = {}
+        def find(cell):
+            while parent[cell] != cell:
+                parent[cell] = parent[parent[cell]]
+                cell = parent[cell]
+            return cell
+
+        for group, value in constraints:
+            for cell in group:
+                parent.setdefault(cell, cell)
+            first = find(next(iter(group)))
+            for cell in group:
+                parent[find(cell)] = first
+
+        groups = {}
+        for constraint in constraints:
+            root = find(next(iter(constraint[0])))
+            groups.setdefault(root, []).append(constraint)
+
+        return list(groups.values())
+
+    def component_result(self, constraints, cache):
+        key = frozenset(constraints)
+        try:
+            result = self._cache[key]
+            self.reused += 1
+        except KeyError:
+            # Visit cells constraint by constraint so that constraints close early
+            cells = []
+            seen = set()
+            for group, value in sorted(constraints, key=lambda c: min(c[0])):
+                for cell in sorted(group):
+                    if cell not in seen:
+                        seen.add(cell)
+                        cells.append(cell)
+            result = enumerate_component(cells, constraints, self.MAX_WORK)
+            if result is None:
+                result = estimate_component(cells, constraints)
+                self.estimated += 1
+            else:
+                self.enumerated += 1
+        cache[key] = result
+        return result
+
+    def solve(self, tiles):
+        """
+        Returns a grid of probabilities in the shape of tiles,
+        with None for tiles that are not unknown.
+        """
+        self.enumerated = self.reused = self.estimated = 0
+
+        constraints, unknown, knownmines = self.constraints(tiles)
+
+        cache = {}
+        results = [self.component_result(c, cache) for c in self.components(constraints)]
+        self._cache = cache
+
+        frontier = set(itertools.chain.from_iterable(r.cells for r in results))
+        interior = len(unknown) - len(frontier)
+        mines = self.mines - knownmines
+
+        # others[c] is the distribution of mines over every component except c
+        dists = [r.counts for r in results]
+        prefix = [{0: 1}]
+        for d in dists:
+            prefix.append(convolve(prefix[-1], d))
+        suffix = [{0: 1}]
+        for d in reversed(dists):
+            suffix.append(convolve(suffix[-1], d))
+        suffix.reverse()
+        others = [convolve(prefix[i], suffix[i+1]) for i in range(len(dists))]
+
+        total = sum(count * binomial(interior, mines-k)
+                    for k, count in prefix[-1].items())
+        if total == 0:
+            raise ValueError('No mine configuration is consistent with the board')
+
+        probs = [[None] * len(row) for row in tiles]
+
+        for result, other in zip(results, others):
+            if result.cellcounts is None:
+                continue # Estimated, its tiles stay unknown
+            # weight[k] is the number of ways to complete the board
+            # given that this component uses k mines
+            weight = {k: sum(count * binomial(interior, mines-k-ko)
+                             for ko, count in other.items())
+                      for k in result.counts}
+            for i, (row, col) in enumerate(result.cells):
+                probs[row][col] = sum(cc[i] * weight[k]
+                                      for k, cc in result.cellcounts.items()) / total
+
+        if interior:
+            # Each interior tile holds a mine in binomial(interior-1, m-1)
+            # of the binomial(interior, m) ways to place m interior mines
+            p = sum(count * binomial(interior-1, mines-k-1)
+                    for k, count in prefix[-1].items()) / total
+            for row, col in unknown - frontier:
+                probs[row][col] = p
+
+        return probs
+
+""" Overlay """
+
+class ProbabilityOverlay(Box):
+    """
+    Tints each unknown tile of a Board according to its mine probability.
+
+    The overlay is drawn on top of the board's tiles,
+    so call draw after the display has been drawn,
+    and update whenever tile states change.
+    update only repaints the tiles whose tint changed.
+
+        >>> from PIL import Image
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage
+
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> displayimg = DisplayImage(None)
+        >>> display = Display(displayimg, skin, boardcols=4, boardrows=2)
+        >>> displayimg.pil_image = Image.new(size=display.size, mode="RGBA")
+        >>> display.draw()
+
+        >>> overlay = ProbabilityOverlay(displayimg, display.board, mines=2)
+        >>> overlay.draw()
+        >>> display.tiles[0][0].state = TileState.Number[1]
+        >>> display.tiles[0][0].draw()
+        >>> sorted(overlay.update())
+        [(0, 0), (0, 1), (1, 0), (1, 1)]
+        >>> overlay.update()
+        []
+        >>> len(overlay.frametimes)
+        3
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, image, board, mines, levels=32,
+        colour=(255, 0, 0), maxalpha=160, maxframes=256):
+        self.image = image
+        self.board = board
+        self.tiles = board.tiles
+        self.solver = ProbabilitySolver(mines)
+        self.levels = levels
+
+        tilesize = self.tiles[0][0].size
+        # tints[level] is pasted over a tile, using its own alpha as the mask
+        self.tints = [Image.new('RGBA', tilesize, colour + (maxalpha*level//(levels-1),))
+                      for level in range(levels)]
+
+        self.probabilities = None
+        self.tilelevels = [[None] * len(row) for row in self.tiles]
+
+        # (solve seconds, draw seconds) for the most recent frames
+        self.frametimes = deque(maxlen=maxframes)
+
+        Box.__init__(self, 0, 0, expandfactor=0)
+
+    def level(self, p):
+        if p is None:
+            return None
+        return round(p * (self.levels-1))
+
+    def draw_tile(self, row, col):
+        tile = self.tiles[row][col]
+        tile.draw()
+        level = self.tilelevels[row][col]
+        if level:
+            self.image.paste(self.tints[level], tile.offset)
+
+    def solve(self):
+        states = [[tile.state for tile in row] for row in self.tiles]
+        self.probabilities = self.solver.solve(states)
+        return [[self.level(p) for p in row] for row in self.probabilities]
+
+    def update(self):
+        """ Solves the board again and repaints tiles whose tint changed """
+        start = time.perf_counter()
+        levels = self.solve()
+        solved = time.perf_counter()
+
+        changed = []
+        for i, (row, oldrow) in enumerate(zip(levels, self.tilelevels)):
+            for j, (level, oldlevel) in enumerate(zip(row, oldrow)):
+                if level != oldlevel:
+                    changed.append((i, j))
+        self.tilelevels = levels
+
+        for row, col in changed:
+            self.draw_tile(row, col)
+
+        self.frametimes.append((solved - start, time.perf_counter() - solved))
+        return changed
+
+    def draw(self):
+        """ Solves the board and repaints every tile """
+        start = time.perf_counter()
+        self.tilelevels = self.solve()
+        solved = time.perf_counter()
+
+        for i, row in enumerate(self.tiles):
+            for j in range(len(row)):
+                self.draw_tile(i, j)
+
+        self.frametimes.append((solved - start, time.perf_counter() - solved))
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,283 @@
+"""
+Per-box render profiling
+
+While a RenderProfile is active, the draw method of every Box class
+and the paste methods of every DisplayImage class are wrapped
+to record wall time, paste calls and pixels written.
+The results are kept as a tree of the display's parts,
+with one node per (box class, part name) under each parent.
+Boxes drawn on their own rather than by their parent's draw
+(the static layer's boxes, and the sprites of a full Display.draw)
+are filed under the parts they belong to all the same.
+
+When no profile is active the original methods are in place,
+so drawing costs nothing extra.
+
+Set PYSWEEP_PROFILE to a filename (or - for stderr)
+to profile the whole run and write the report on exit.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import time
+
+from .box import Box
+from .display import Display, DisplayImage
+
+
+def subclasses(cls):
+    """ cls and all of its subclasses """
+    yield cls
+    for sub in cls.__subclasses__():
+        yield from subclasses(sub)
+
+def part_names(root):
+    """
+    Maps id(box) to the attribute name its parent stores it under,
+    eg. 'panel', 'board', 'lcounter', 'tl'.
+    """
+    names = {id(root): type(root).__name__.lower()}
+    for box in root.walk():
+        for attr, value in vars(box).items():
+            if isinstance(value, Box) and value is not box:
+                names.setdefault(id(value), attr)
+    return names
+
+def part_paths(root):
+    """ Maps id(box) to the boxes above it, from root down to its parent """
+    paths = {id(root): ()}
+    stack = [(root, ())]
+    while stack:
+        box, path = stack.pop()
+        path = path + (box,)
+        for child in box.children():
+            paths[id(child)] = path
+            stack.append((child, path))
+    return paths
+
+class ProfileNode:
+    def __init__(self, cls, name):
+        self.cls = cls
+        self.name = name
+        self.calls = 0
+        self.time = 0
+        self.pastes = 0
+        self.pixels = 0
+        self.children = {} # Map of (class name, part name) to ProfileNode
+        self.drawn = None # The enclosing draw this node was last filed under, see RenderProfile._wrap_draw
+
+    def child(self, cls, name):
+        try:
+            return self.children[(cls, name)]
+        except KeyError:
+            node = self.children[(cls, name)] = ProfileNode(cls, name)
+            return node
+
+    def total_pastes(self):
+        return self.pastes + sum(c.total_pastes() for c in self.children.values())
+
+    def total_pixels(self):
+        return self.pixels + sum(c.total_pixels() for c in self.children.values())
+
+    def format(self, depth=0):
+        label = self.cls if self.name is None else f'{self.cls} {self.name}'
+        lines = [f'''{'  '*depth}{label}: {self.calls} calls, {self.time*1000:.3f}ms, '''
+                 f'''{self.total_pastes()} pastes, {self.total_pixels()} pixels''']
+        for c in self.children.values():
+            lines.extend(c.format(depth+1))
+        return lines
+
+class RenderProfile:
+    """
+    Context manager that profiles every draw made while it is active.
+
+        >>> from PIL import Image
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display
+
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> displayimg = DisplayImage(None)
+        >>> display = Display(displayimg, skin, boardcols=4, boardrows=2)
+        >>> displayimg.pil_image = Image.new(size=display.size, mode="RGBA")
+
+    The first full draw composites the static layer, then pastes it and draws the sprites on top.
+    Each box is filed under the part it belongs to
+        >>> drawfunc = Display.draw
+        >>> with RenderProfile(display) as profile:
+        ...     display.draw()
+        >>> Display.draw is drawfunc
+        True
+        >>> print(profile.report()) # doctest: +ELLIPSIS
+        Display display: 1 calls, ...ms, 58 pastes, 54520 pixels
+          BorderBox: 1 calls, ...
+            GridBox innerbox: 1 calls, ...
+              Panel panel: 1 calls, ...
+                GridTile bg: 1 calls, ...ms, 1 pastes, 5762 pixels
+                BorderBox: 1 calls, ...
+                  GridBox innerbox: 1 calls, ...
+                    Counter lcounter: 1 calls, ...ms, 11 pastes, 1025 pixels
+        ...
+              Board board: 1 calls, ...ms, 17 pastes, 18760 pixels
+        ...
+                    UniformGridBox tilesbox: 1 calls, ...ms, 8 pastes, 8192 pixels
+                      Tile: 8 calls, ...ms, 8 pastes, 8192 pixels
+          Border border: 1 calls, ...ms, 8 pastes, 4770 pixels
+        ...
+
+    Later full draws reuse the static layer (its paste is the display's own).
+    Without a profile they run the compiled display list,
+    while profiling they draw each sprite so the parts can be told apart.
+        >>> with RenderProfile(display) as profile:
+        ...     display.draw()
+        >>> print(profile.report()) # doctest: +ELLIPSIS
+        Display display: 1 calls, ...ms, 16 pastes, 30574 pixels
+          BorderBox: 1 calls, ...
+            GridBox innerbox: 1 calls, ...
+              Panel panel: 1 calls, ...ms, 7 pastes, 2470 pixels
+                BorderBox: 1 calls, ...
+                  GridBox innerbox: 1 calls, ...
+                    Counter lcounter: 1 calls, ...ms, 3 pastes, 897 pixels
+                      BorderBox: 1 calls, ...
+                        GridBox innerbox: 1 calls, ...
+                          Digit: 3 calls, ...ms, 3 pastes, 897 pixels
+                    Face face: 1 calls, ...ms, 1 pastes, 676 pixels
+                    Counter rcounter: 1 calls, ...ms, 3 pastes, 897 pixels
+        ...
+              Board board: 1 calls, ...ms, 8 pastes, 8192 pixels
+        ...
+                      Tile: 8 calls, ...ms, 8 pastes, 8192 pixels
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    _active = None
+
+    def __init__(self, display=None):
+        self.names = part_names(display) if display is not None else {}
+        self.paths = part_paths(display) if display is not None else {}
+        self.root = ProfileNode('(root)', None)
+        self._stack = [(self.root, None)] # (node, box) of each draw in progress
+        self._originals = []
+
+    @classmethod
+    def from_environ(cls, display, environ=os.environ):
+        """ A started profile reporting to $PYSWEEP_PROFILE on exit, or None if unset """
+        path = environ.get('PYSWEEP_PROFILE')
+        if not path:
+            return None
+        profile = cls(display)
+        profile.start()
+        atexit.register(profile.write_report, path)
+        return profile
+
+    def start(self):
+        if RenderProfile._active is not None:
+            raise RuntimeError('A RenderProfile is already active')
+        RenderProfile._active = self
+
+        for cls in subclasses(Box):
+            if 'draw' in vars(cls):
+                self._patch(cls, 'draw', self._wrap_draw)
+        for cls in subclasses(DisplayImage):
+            if 'paste' in vars(cls):
+                self._patch(cls, 'paste', self._wrap_paste)
+            if 'paste_pixel' in vars(cls):
+                self._patch(cls, 'paste_pixel', self._wrap_paste_pixel)
+
+    def stop(self):
+        for cls, attr, func in reversed(self._originals):
+            setattr(cls, attr, func)
+        self._originals = []
+        RenderProfile._active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _patch(self, cls, attr, wrapper):
+        func = vars(cls)[attr]
+        self._originals.append((cls, attr, func))
+        setattr(cls, attr, functools.wraps(func)(wrapper(func)))
+
+    def _wrap_draw(self, draw):
+        """
+        Records calls of draw under a node for the box.
+        When the box is drawn from further up than its parent,
+        nodes for the parts in between are filled in,
+        each counted once per enclosing draw and timed with everything drawn under it.
+        """
+        stack = self._stack
+        names = self.names
+        paths = self.paths
+        clock = time.perf_counter
+        def wrapper(box, *args, **kwargs):
+            parent, parentbox = stack[-1]
+            between = ()
+            path = paths.get(id(box), ())
+            if path and path[-1] is not parentbox:
+                for i, ancestor in enumerate(path):
+                    if ancestor is parentbox:
+                        between = path[i+1:]
+                        break
+            enclosing = stack[-1]
+            filled = []
+            for ancestor in between:
+                parent = parent.child(type(ancestor).__name__, names.get(id(ancestor)))
+                if parent.drawn is not enclosing:
+                    parent.drawn = enclosing
+                    parent.calls += 1
+                filled.append(parent)
+                stack.append((parent, ancestor))
+            node = parent.child(type(box).__name__, names.get(id(box)))
+            frame = (node, box)
+            stack.append(frame)
+            start = clock()
+            try:
+                return draw(box, *args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                node.time += elapsed
+                node.calls += 1
+                for ancestor in filled:
+                    ancestor.time += elapsed
+                del stack[-1 - len(filled):]
+        return wrapper
+
+    def _wrap_paste(self, paste):
+        stack = self._stack
+        def wrapper(image, img, coords, *args, **kwargs):
+            node = stack[-1][0]
+            node.pastes += 1
+            node.pixels += img.size[0] * img.size[1]
+            return paste(image, img, coords, *args, **kwargs)
+        return wrapper
+
+    def _wrap_paste_pixel(self, paste_pixel):
+        stack = self._stack
+        def wrapper(image, pixel, coords, *args, **kwargs):
+            node = stack[-1][0]
+            node.pastes += 1
+            node.pixels += (coords[2] - coords[0]) * (coords[3] - coords[1])
+            return paste_pixel(image, pixel, coords, *args, **kwargs)
+        return wrapper
+
+    def report(self):
+        lines = []
+        for node in self.root.children.values():
+            lines.extend(node.format())
+        return '\n'.join(lines)
+
+    def write_report(self, path):
+        if path == '-':
+            print(self.report(), file=sys.stderr)
+        else:
+            with open(path, 'w') as f:
+                f.write(self.report() + '\n')
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,206 @@
+"""
+Double-buffered rendering on a worker thread
+
+The Tk thread never draws.
+It hands state changes to a RenderThread, which applies them to the Display
+and draws into a back buffer on its own thread.
+Once a batch of changes is drawn the buffers are swapped under a lock,
+and the Tk thread uploads the front buffer whenever a new frame is ready.
+
+After a swap the new back buffer is one frame behind,
+so the rectangles drawn in the last frame are copied across from the front buffer
+before anything else is drawn into it.
+"""
+
+import queue
+import threading
+
+from PIL import Image
+
+from .display import Counter
+
+
+class RenderThread:
+    """
+    Draws display on a worker thread.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage, TileState
+
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> display = Display(DisplayImage(None), skin, boardcols=8, boardrows=8)
+        >>> renderer = RenderThread(display)
+        >>> renderer.start()
+        >>> renderer.flush()
+        1
+
+    Changes are drawn and swapped in as one frame
+        >>> for j in range(8):
+        ...     renderer.set_state(display.tiles[0][j], TileState.Number[1])
+        >>> renderer.set_state(display.lcounter, 42)
+        >>> renderer.flush() > 1
+        True
+
+    A change that fails is raised from the next flush, and the thread carries on
+        >>> renderer.set_state(display.tiles[1][0], None)
+        >>> renderer.flush()
+        Traceback (most recent call last):
+          ...
+        AttributeError: 'NoneType' object has no attribute 'code'
+        >>> renderer.set_state(display.tiles[1][0], TileState.Unopened)
+        >>> renderer.flush() > 1
+        True
+
+    Both buffers end up with the same picture as drawing directly
+        >>> renderer.stop()
+        >>> direct = Image.new(size=display.size, mode="RGBA")
+        >>> display.image.pil_image = direct
+        >>> display.draw()
+        >>> renderer.front.tobytes() == renderer.back.tobytes() == direct.tobytes()
+        True
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, display):
+        self.display = display
+        self.front = Image.new(size=display.size, mode="RGBA")
+        self.back = Image.new(size=display.size, mode="RGBA")
+        display.image.pil_image = self.back
+        display.image.take_dirty()
+
+        self.lock = threading.Lock() # Held while swapping, and while the front buffer is read
+        self.frame = 0 # Number of the frame in the front buffer
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._error = None # First exception raised on the worker since the last flush
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='pysweep-render', daemon=True)
+        self._thread.start()
+        self.redraw()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    """ Called from the main thread """
+
+    def set_state(self, target, state):
+        """ Sets the state of a Sprite or Counter and draws it """
+        self._queue.put(('state', target, state))
+
+    def redraw(self):
+        """ Draws the whole display """
+        self._queue.put(('redraw',))
+
+    def flush(self, timeout=None):
+        """ Waits until everything submitted so far is in the front buffer, returns its frame number """
+        if self._thread is None or not self._thread.is_alive():
+            raise RuntimeError('The render thread is not running')
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        done.wait(timeout)
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+        return self.frame
+
+    """ Worker thread """
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            flushes = []
+            # Take every change waiting, so a burst of them is drawn as one frame
+            try:
+                while item is not None:
+                    try:
+                        self._apply(item, flushes)
+                    except Exception as e: # Kept for flush to raise, the thread goes on
+                        self._error = self._error or e
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self._present()
+            except Exception as e:
+                self._error = self._error or e
+            finally:
+                for done in flushes:
+                    done.set()
+            if item is None:
+                return
+
+    def _apply(self, item, flushes):
+        kind = item[0]
+        if kind == 'state':
+            target, state = item[1:]
+            target.state = state
+            if isinstance(target, Counter):
+                target.draw_changed()
+            else:
+                target.draw()
+        elif kind == 'redraw':
+            self.display.draw()
+        elif kind == 'flush':
+            flushes.append(item[1])
+
+    def _present(self):
+        image = self.display.image
+        dirty = image.take_dirty()
+        if not dirty:
+            return
+        with self.lock:
+            self.front, self.back = self.back, self.front
+            self.frame += 1
+        image.pil_image = self.back
+        # Catch the new back buffer up with the frame just presented
+        for rect in dict.fromkeys(dirty):
+            self.back.paste(self.front.crop(rect), rect[:2])
+
+try: # pragma: no cover
+    import tkinter
+    from PIL import ImageTk
+
+    class ThreadedDisplayCanvas(tkinter.Canvas):
+        """ Shows the frames of a RenderThread, uploading each one on the Tk thread """
+        def __init__(self, master, display, tracker=None, interval=8):
+            self.master = master
+            self.display = display
+            self.tracker = tracker # latency.LatencyTracker, optional
+            self.interval = interval # ms between checks for a new frame
+            self.size = display.size
+
+            super().__init__(self.master, width=self.size[0], height=self.size[1], highlightthickness=0)
+
+            self.renderer = RenderThread(display)
+            self.tkimg = ImageTk.PhotoImage(self.renderer.front)
+            self.imageitem = self.create_image(0, 0, image=self.tkimg, anchor='nw')
+            self.uploaded = 0
+            self.renderer.start()
+            self.poll()
+
+        def poll(self):
+            if self.renderer.frame != self.uploaded:
+                self.draw()
+            self.after(self.interval, self.poll)
+
+        def draw(self):
+            if self.tracker is not None:
+                self.tracker.mark('redraw')
+            with self.renderer.lock:
+                self.uploaded = self.renderer.frame
+                self.tkimg.paste(self.renderer.front)
+            if self.tracker is not None:
+                self.tracker.mark('present')
+
+        def destroy(self):
+            self.renderer.stop()
+            super().destroy()
+except ImportError: # pragma: no cover
+    pass
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
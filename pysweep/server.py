@@ -0,0 +1,345 @@
+"""
+Headless multi-session game server
+
+Hosts many games from one asyncio process over a local socket.
+Every session has its own Game, Display and framebuffer,
+while all of them share one preloaded Skin (and so one copy of every decoded image).
+
+Clients send JSON lines:
+
+    {"op": "new", "rows": 16, "cols": 30, "mines": 99, "seed": 1}
+    {"op": "open", "session": 1, "row": 3, "col": 4}     (also "flag" and "chord")
+    {"op": "table", "session": 1}
+    {"op": "close", "session": 1}
+    {"op": "stats"}
+
+Every request is answered with one message:
+
+    >II      header length, body length
+    header   JSON object (session, status, number of patches, ...)
+    body     a patch.PatchEncoder stream of the rectangles changed since the last frame
+
+The first frame of a session covers the whole display.
+Its header names the image table the patches refer to,
+which clients that don't have it yet fetch once with "table".
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import struct
+import time
+import tracemalloc
+
+from PIL import Image
+
+from .display import Display, DisplayImage, FaceState
+from .game import Game
+from .patch import PatchEncoder, PatchDecoder
+
+
+MESSAGE = struct.Struct('>II')
+
+""" Sessions """
+
+class Session:
+    """
+    One game and the display showing it.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> session = Session(skin, 4, 4, 3, seed=1)
+        >>> decoder = PatchDecoder(session.encoder.images, session.display.size)
+        >>> decoder.apply(session.frame())
+        1
+        >>> len(session.act('open', 0, 0))
+        8
+        >>> data = session.frame()
+        >>> len(data), decoder.apply(data)
+        (56, 8)
+        >>> decoder.frame.tobytes() == session.image.pil_image.tobytes()
+        True
+        >>> session.frame()
+        b''
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, skin, rows, cols, mines, seed=None):
+        self.game = Game(rows, cols, mines, seed)
+        self.image = DisplayImage(None)
+        self.display = display = Display(self.image, skin, boardrows=rows, boardcols=cols)
+        self.image.pil_image = Image.new(size=display.size, mode="RGBA")
+        self.encoder = PatchEncoder.for_display(display)
+
+        display.lcounter.state = mines
+        display.draw()
+        self.image.take_dirty()
+        self.image.invalidate((0, 0) + display.size)
+
+    def act(self, action, row, col):
+        game, display = self.game, self.display
+
+        changes = game.act(action, row, col)
+        for i, j, state in changes:
+            tile = display.tiles[i][j]
+            tile.state = state
+            tile.draw()
+
+        display.lcounter.state = game.minesleft
+        display.lcounter.draw_changed()
+
+        face = {'won': FaceState.Cool, 'lost': FaceState.Blast}.get(game.status, FaceState.Happy)
+        if display.face.state is not face:
+            display.face.state = face
+            display.face.draw()
+
+        return changes
+
+    def frame(self):
+        """ Encoded patches for everything repainted since the last frame """
+        return self.encoder.encode(self.image.pil_image, self.image.take_dirty())
+
+    @property
+    def framebuffer_bytes(self):
+        width, height = self.display.size
+        return width * height * 4
+
+def session_memory(skin, rows, cols, mines, n=10):
+    """
+    Average memory used per session, as
+    {'python': bytes of Python objects, 'framebuffer': bytes of pixels}.
+
+    The skin is preloaded first, so this only counts per-session state.
+    PIL allocates pixels outside of tracemalloc's view, so those are counted separately.
+    """
+    skin.preload_skin()
+    Session(skin, rows, cols, mines) # Loads the sprite tables
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = [Session(skin, rows, cols, mines) for i in range(n)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        if started:
+            tracemalloc.stop()
+    return {
+        'python': (after - before) // n,
+        'framebuffer': sessions[0].framebuffer_bytes,
+    }
+
+""" Server """
+
+class GameServer:
+    """
+    Serves sessions over asyncio streams.
+
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+        >>> server = GameServer(skin)
+
+        >>> async def play():
+        ...     await server.start()
+        ...     client = await LocalClient.connect(*server.address)
+        ...     new = await client.request(op='new', rows=4, cols=4, mines=3, seed=1)
+        ...     sid = new['session']
+        ...     opened = await client.request(op='open', session=sid, row=0, col=0)
+        ...     same = client.frames[sid].tobytes() == server.sessions[sid].image.pil_image.tobytes()
+        ...     error = await client.request(op='open', session=123, row=0, col=0)
+        ...     outside = await client.request(op='open', session=sid, row=4, col=0)
+        ...     still = await client.request(op='flag', session=sid, row=3, col=3)
+        ...     await client.close()
+        ...     await server.stop()
+        ...     return new['patches'], opened['patches'], opened['status'], same, error, outside, still['patches']
+        >>> asyncio.run(play())
+        (1, 8, 'playing', True, {'error': 'No session 123'}, {'error': 'No tile at row 4, col 0'}, 2)
+
+        >>> stats = server.stats()
+        >>> stats['sessions'], stats['frames']
+        (0, 3)
+        >>> skin.cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, skin):
+        skin.preload_skin()
+        self.skin = skin
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self.server = None
+        self.tables = [] # PatchEncoders, indexed by table id
+
+        self.frames = 0
+        self.framebytes = 0
+        self.frametime = 0
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def start_unix(self, path): # pragma: no cover
+        self.server = await asyncio.start_unix_server(self.handle, path)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    header, body = self.request(json.loads(line), owned)
+                except Exception as e: # A bad request only fails itself, not the connection
+                    header, body = {'error': str(e).strip("'")}, b''
+                header = json.dumps(header).encode()
+                writer.write(MESSAGE.pack(len(header), len(body)) + header + body)
+                await writer.drain()
+        finally:
+            for sid in owned:
+                self.sessions.pop(sid, None)
+            writer.close()
+
+    def request(self, message, owned):
+        op = message['op']
+
+        if op == 'stats':
+            return self.stats(), b''
+
+        if op == 'new':
+            sid = next(self._ids)
+            session = self.sessions[sid] = Session(self.skin,
+                message['rows'], message['cols'], message['mines'], message.get('seed'))
+            owned.add(sid)
+            return self.frame(sid, session, [])
+
+        sid = message['session']
+        if sid not in owned:
+            raise KeyError(f'No session {sid}')
+        if op == 'close':
+            del self.sessions[sid]
+            owned.discard(sid)
+            return {'session': sid, 'closed': True}, b''
+
+        session = self.sessions[sid]
+        if op == 'table':
+            return {'session': sid, 'table': self.table_id(session)}, session.encoder.table_bytes()
+
+        start = time.perf_counter()
+        changes = session.act(op, message['row'], message['col'])
+        self.frametime += time.perf_counter() - start
+        return self.frame(sid, session, changes)
+
+    def table_id(self, session):
+        for i, encoder in enumerate(self.tables):
+            if encoder is session.encoder:
+                return i
+        self.tables.append(session.encoder)
+        return len(self.tables) - 1
+
+    def frame(self, sid, session, changes):
+        start = time.perf_counter()
+        rects = session.image.dirty[:]
+        body = session.frame()
+        self.frametime += time.perf_counter() - start
+        self.frames += 1
+        self.framebytes += len(body)
+        return {
+            'session': sid,
+            'status': session.game.status,
+            'changes': len(changes),
+            'patches': len(dict.fromkeys(rects)),
+            'size': session.display.size,
+            'table': self.table_id(session),
+        }, body
+
+    def stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'frames': self.frames,
+            'bytes': self.framebytes,
+            'frames_per_second': self.frames / self.frametime if self.frametime else None,
+        }
+
+class LocalClient:
+    """
+    A client stand-in that keeps its own copy of every session's frame.
+    """
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.tables = {}   # Map of table id to table bytes
+        self.decoders = {} # Map of session id to PatchDecoder
+
+    @property
+    def frames(self):
+        return {sid: decoder.frame for sid, decoder in self.decoders.items()}
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def _request(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+        headerlen, bodylen = MESSAGE.unpack(await self.reader.readexactly(MESSAGE.size))
+        header = json.loads(await self.reader.readexactly(headerlen))
+        body = await self.reader.readexactly(bodylen)
+        return header, body
+
+    async def request(self, **message):
+        header, body = await self._request(message)
+        if 'size' in header:
+            sid = header['session']
+            if sid not in self.decoders:
+                if header['table'] not in self.tables:
+                    table, data = await self._request({'op': 'table', 'session': sid})
+                    self.tables[table['table']] = data
+                self.decoders[sid] = PatchDecoder.from_table_bytes(
+                    self.tables[header['table']], tuple(header['size']))
+            self.decoders[sid].apply(body)
+        return header
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def main(argv=None): # pragma: no cover
+    from .skin import Skin
+    from .dirstruct import Multi, Dir
+
+    parser = argparse.ArgumentParser(description='PySweeper headless game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a unix socket instead')
+    parser.add_argument('--measure', action='store_true',
+        help='print the memory used per expert session and exit')
+    args = parser.parse_args(argv)
+
+    skin = Skin(Multi(Dir('images_d_tiles'), Dir('images')))
+
+    if args.measure:
+        print(json.dumps(session_memory(skin, 16, 30, 99)))
+        return
+
+    async def serve():
+        server = GameServer(skin)
+        if args.unix:
+            await server.start_unix(args.unix)
+        else:
+            await server.start(args.host, args.port)
+        async with server.server:
+            await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+if __name__ == "__main__": # pragma: no cover
+    main()
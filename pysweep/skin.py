@@ -1,4 +1,5 @@
 from pathlib import PurePath
+import weakref
 
 from PIL import Image
 
@@ -6,6 +7,57 @@ from .dirstruct import Multi, DirBase
 from .box import Thickness # For border validation
 
 
+""" Transparency """
+
+OPAQUE = 'opaque' # Every pixel has full alpha, paste it with a plain copy
+BINARY = 'binary' # Pixels are either fully transparent or fully opaque, paste it through a 1 bit mask
+ALPHA = 'alpha'   # Partial transparency, paste it through its alpha band
+
+def classify_alpha(img):
+    """
+    Returns (kind, mask) for img, where mask is what to paste img through
+    (None for OPAQUE images).
+
+        >>> classify_alpha(Image.new('RGBA', (2, 2), (1, 2, 3, 255)))
+        ('opaque', None)
+        >>> img = Image.new('RGBA', (2, 2), (1, 2, 3, 255))
+        >>> img.putpixel((0, 0), (0, 0, 0, 0))
+        >>> classify_alpha(img)
+        ('binary', <PIL.Image.Image image mode=1 size=2x2 at 0x...>)
+        >>> img.putpixel((0, 0), (0, 0, 0, 128))
+        >>> classify_alpha(img)
+        ('alpha', <PIL.Image.Image image mode=L size=2x2 at 0x...>)
+        >>> classify_alpha(Image.new('RGB', (2, 2)))
+        ('opaque', None)
+    """
+    if 'A' not in img.getbands():
+        return (OPAQUE, None)
+    alpha = img.split()[img.getbands().index('A')] # getchannel needs Pillow 4.3
+    low, high = alpha.getextrema()
+    if low == 255:
+        return (OPAQUE, None)
+    histogram = alpha.histogram()
+    if sum(histogram[1:255]) == 0:
+        return (BINARY, alpha.point(lambda a: 255 if a else 0, '1'))
+    return (ALPHA, alpha)
+
+def alpha_info(img):
+    """
+    classify_alpha(img), remembered for as long as img is alive,
+    so the draw path only pays for a dict lookup.
+    """
+    key = id(img)
+    try:
+        ref, kind, mask = ImageLoader._alpha[key]
+        if ref() is img:
+            return kind, mask
+    except KeyError:
+        pass
+    kind, mask = classify_alpha(img)
+    table = ImageLoader._alpha
+    ImageLoader._alpha[key] = (weakref.ref(img, lambda ref: table.pop(key, None)), kind, mask)
+    return kind, mask
+
 class ImageLoader(DirBase):
     """
     Wraps around a Dir-like or a Multi and tries to load files as images.
@@ -38,8 +90,25 @@ class ImageLoader(DirBase):
         >>> il.cache[(il._source, PurePath('border/t.png'))]
         <PIL.PngImagePlugin.PngImageFile image mode=RGBA size=1x9 at 0x...>
         >>> assert len(il.cache) == len(il2.cache) == len(il3.cache) == 5
+
+    # Zoomed loaders resample each image once per zoom level
+        >>> il4 = il.zoomed(2)
+        >>> il4.board.tile['0.png'].open()
+        <PIL.Image.Image image mode=RGBA size=64x64 at 0x...>
+        >>> il4.board.tile['0.png'].open() is il4.board.tile['0.png'].open()
+        True
+
+    # Dimensions of 1 pixel are stretched when drawn, so they are left alone
+        >>> il.zoomed(1.5).border['b.png'].open()
+        <PIL.Image.Image image mode=RGBA size=1x14 at 0x...>
+        >>> assert len(il.cache) == 5
+        >>> sorted(len(cache) for cache in il.scaledcache.values())
+        [1, 1]
     """
     _cache = {} # Map of (source: Multi or Dir-like, path: Path-like) to img: Image
+    _scaledcache = {} # Map of zoom to a map like _cache of resampled images
+    _alpha = {} # Map of id(img) to (weakref to img, kind, mask), see alpha_info
+    _generation = 0 # Counts resets of the cache, so caches built from it can tell they're stale
 
     @property
     def cache(self):
@@ -47,14 +116,30 @@ class ImageLoader(DirBase):
     @cache.setter
     def cache(self, value):
         ImageLoader._cache = value
+        ImageLoader._scaledcache = {}
+        ImageLoader._generation += 1
 
-    def __init__(self, source, path=''):
+    @property
+    def generation(self):
+        return ImageLoader._generation
+
+    @property
+    def scaledcache(self):
+        return ImageLoader._scaledcache
+
+    def __init__(self, source, path='', zoom=1):
         self._source = source
         self._path = PurePath(path)
+        self.zoom = zoom
     def get(self, path):
         newpath = self._path.joinpath(path)
-        return ImageLoader(self._source, newpath)
+        return ImageLoader(self._source, newpath, self.zoom)
+    def zoomed(self, zoom):
+        """ The same loader, but opening images resampled by zoom """
+        return type(self)(self._source, self._path, zoom)
     def open(self):
+        if self.zoom != 1:
+            return self._open_scaled()
         try:
             return self.cache[(self._source, self._path)]
         except KeyError:
@@ -65,9 +150,27 @@ class ImageLoader(DirBase):
                 img = Image.open(loc.open('rb'))
             else:
                 raise TypeError('source was not Multi or DirBase')
+            alpha_info(img)
             self.cache[(self._source, self._path)] = img
             return img
 
+    def _open_scaled(self):
+        cache = self.scaledcache.setdefault(self.zoom, {})
+        try:
+            return cache[(self._source, self._path)]
+        except KeyError:
+            img = ImageLoader(self._source, self._path).open()
+            # Integer zooms keep hard pixel edges
+            if self.zoom == int(self.zoom):
+                resample = Image.NEAREST
+            else:
+                resample = Image.LANCZOS
+            # 1 pixel dimensions are stretched when drawn (see GridTile.PasteType), keep them on the fast path
+            size = tuple(d if d == 1 else max(1, round(d * self.zoom)) for d in img.size)
+            img = cache[(self._source, self._path)] = img.convert('RGBA').resize(size, resample)
+            alpha_info(img)
+            return img
+
     def preload(self, *paths):
         for path in paths:
             self.get(path).open()
@@ -126,94 +229,125 @@ class Skin(ImageLoader):
 "All borders must have consistent thickness. Expected height 9 from border/bl.png but 'border/b.png' has height 1.", \
 "Sprites must be of the same size. Expected size (26, 26) from 'panel/face/blast.png', but 'panel/face/cool.png' has size (16, 16).")
     """
+    FILES = ( # Every skinnable image, see preload_skin
+        'board/bg.png',
+        'board/border/b.png',
+        'board/border/bl.png',
+        'board/border/br.png',
+        'board/border/l.png',
+        'board/border/r.png',
+        'board/border/t.png',
+        'board/border/tl.png',
+        'board/border/tr.png',
+        'board/tile/0.png',
+        'board/tile/1.png',
+        'board/tile/2.png',
+        'board/tile/3.png',
+        'board/tile/4.png',
+        'board/tile/5.png',
+        'board/tile/6.png',
+        'board/tile/7.png',
+        'board/tile/8.png',
+        'board/tile/blast.png',
+        'board/tile/flag.png',
+        'board/tile/flag_wrong.png',
+        'board/tile/mine.png',
+        'board/tile/unopened.png',
+        'border/b.png',
+        'border/bl.png',
+        'border/br.png',
+        'border/l.png',
+        'border/r.png',
+        'border/t.png',
+        'border/tl.png',
+        'border/tr.png',
+        'panel/bg.png',
+        'panel/border/b.png',
+        'panel/border/bl.png',
+        'panel/border/br.png',
+        'panel/border/l.png',
+        'panel/border/r.png',
+        'panel/border/t.png',
+        'panel/border/tl.png',
+        'panel/border/tr.png',
+        'panel/face/blast.png',
+        'panel/face/cool.png',
+        'panel/face/happy.png',
+        'panel/face/nervous.png',
+        'panel/face/pressed.png',
+        'panel/lcounter/border/b.png',
+        'panel/lcounter/border/bl.png',
+        'panel/lcounter/border/br.png',
+        'panel/lcounter/border/l.png',
+        'panel/lcounter/border/r.png',
+        'panel/lcounter/border/t.png',
+        'panel/lcounter/border/tl.png',
+        'panel/lcounter/border/tr.png',
+        'panel/lcounter/digit/-.png',
+        'panel/lcounter/digit/0.png',
+        'panel/lcounter/digit/1.png',
+        'panel/lcounter/digit/2.png',
+        'panel/lcounter/digit/3.png',
+        'panel/lcounter/digit/4.png',
+        'panel/lcounter/digit/5.png',
+        'panel/lcounter/digit/6.png',
+        'panel/lcounter/digit/7.png',
+        'panel/lcounter/digit/8.png',
+        'panel/lcounter/digit/9.png',
+        'panel/lcounter/digit/off.png',
+        'panel/rcounter/border/b.png',
+        'panel/rcounter/border/bl.png',
+        'panel/rcounter/border/br.png',
+        'panel/rcounter/border/l.png',
+        'panel/rcounter/border/r.png',
+        'panel/rcounter/border/t.png',
+        'panel/rcounter/border/tl.png',
+        'panel/rcounter/border/tr.png',
+        'panel/rcounter/digit/-.png',
+        'panel/rcounter/digit/0.png',
+        'panel/rcounter/digit/1.png',
+        'panel/rcounter/digit/2.png',
+        'panel/rcounter/digit/3.png',
+        'panel/rcounter/digit/4.png',
+        'panel/rcounter/digit/5.png',
+        'panel/rcounter/digit/6.png',
+        'panel/rcounter/digit/7.png',
+        'panel/rcounter/digit/8.png',
+        'panel/rcounter/digit/9.png',
+        'panel/rcounter/digit/off.png',
+    )
+
     def preload_skin(self):
-        self.preload(
-            'board/bg.png',
-            'board/border/b.png',
-            'board/border/bl.png',
-            'board/border/br.png',
-            'board/border/l.png',
-            'board/border/r.png',
-            'board/border/t.png',
-            'board/border/tl.png',
-            'board/border/tr.png',
-            'board/tile/0.png',
-            'board/tile/1.png',
-            'board/tile/2.png',
-            'board/tile/3.png',
-            'board/tile/4.png',
-            'board/tile/5.png',
-            'board/tile/6.png',
-            'board/tile/7.png',
-            'board/tile/8.png',
-            'board/tile/blast.png',
-            'board/tile/flag.png',
-            'board/tile/flag_wrong.png',
-            'board/tile/mine.png',
-            'board/tile/unopened.png',
-            'border/b.png',
-            'border/bl.png',
-            'border/br.png',
-            'border/l.png',
-            'border/r.png',
-            'border/t.png',
-            'border/tl.png',
-            'border/tr.png',
-            'panel/bg.png',
-            'panel/border/b.png',
-            'panel/border/bl.png',
-            'panel/border/br.png',
-            'panel/border/l.png',
-            'panel/border/r.png',
-            'panel/border/t.png',
-            'panel/border/tl.png',
-            'panel/border/tr.png',
-            'panel/face/blast.png',
-            'panel/face/cool.png',
-            'panel/face/happy.png',
-            'panel/face/nervous.png',
-            'panel/face/pressed.png',
-            'panel/lcounter/border/b.png',
-            'panel/lcounter/border/bl.png',
-            'panel/lcounter/border/br.png',
-            'panel/lcounter/border/l.png',
-            'panel/lcounter/border/r.png',
-            'panel/lcounter/border/t.png',
-            'panel/lcounter/border/tl.png',
-            'panel/lcounter/border/tr.png',
-            'panel/lcounter/digit/-.png',
-            'panel/lcounter/digit/0.png',
-            'panel/lcounter/digit/1.png',
-            'panel/lcounter/digit/2.png',
-            'panel/lcounter/digit/3.png',
-            'panel/lcounter/digit/4.png',
-            'panel/lcounter/digit/5.png',
-            'panel/lcounter/digit/6.png',
-            'panel/lcounter/digit/7.png',
-            'panel/lcounter/digit/8.png',
-            'panel/lcounter/digit/9.png',
-            'panel/lcounter/digit/off.png',
-            'panel/rcounter/border/b.png',
-            'panel/rcounter/border/bl.png',
-            'panel/rcounter/border/br.png',
-            'panel/rcounter/border/l.png',
-            'panel/rcounter/border/r.png',
-            'panel/rcounter/border/t.png',
-            'panel/rcounter/border/tl.png',
-            'panel/rcounter/border/tr.png',
-            'panel/rcounter/digit/-.png',
-            'panel/rcounter/digit/0.png',
-            'panel/rcounter/digit/1.png',
-            'panel/rcounter/digit/2.png',
-            'panel/rcounter/digit/3.png',
-            'panel/rcounter/digit/4.png',
-            'panel/rcounter/digit/5.png',
-            'panel/rcounter/digit/6.png',
-            'panel/rcounter/digit/7.png',
-            'panel/rcounter/digit/8.png',
-            'panel/rcounter/digit/9.png',
-            'panel/rcounter/digit/off.png',
-        )
+        self.preload(*self.FILES)
+
+    def stats(self):
+        """
+        Counts of the loaded images of this skin (including resampled ones) by transparency.
+        The cache is shared by every skin, so images of other skins are left out.
+
+            >>> from .dirstruct import Dir
+            >>> skin = Skin(Dir('images'))
+            >>> skin.cache = {}
+            >>> skin.preload_skin()
+            >>> skin.board.tile['0.png'].open().size, skin.zoomed(2).board.tile['0.png'].open().size
+            ((16, 16), (32, 32))
+            >>> skin.stats()
+            {'images': 85, 'scaled': 1, 'opaque': 86, 'binary': 0, 'alpha': 0}
+            >>> from .dirstruct import Multi
+            >>> Skin(Multi(Dir('images_d_tiles'), Dir('images'))).preload_skin()
+            >>> skin.stats()['images']
+            85
+            >>> skin.cache = {} # Clean up for the sake of other tests
+        """
+        def own(cache):
+            return [img for (source, path), img in list(cache.items())
+                    if source is self._source and PurePath(path).is_relative_to(self._path)]
+        images = own(self.cache)
+        scaled = [img for cache in list(self.scaledcache.values()) for img in own(cache)]
+        stats = {'images': len(images), 'scaled': len(scaled), OPAQUE: 0, BINARY: 0, ALPHA: 0}
+        for img in images + scaled:
+            stats[alpha_info(img)[0]] += 1
+        return stats
 
     def validate_skin(self):
         exceptions = []
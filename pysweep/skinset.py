@@ -0,0 +1,113 @@
+"""
+Prewarmed skins for instant switching
+
+A SkinSet loads several skins on a background thread ahead of time,
+decoding every image and building the sprite tables,
+so switching a Display to one of them (Display.set_skin) only retargets its parts
+and takes a single frame.
+"""
+
+import threading
+
+from .display import Counter, Face, Tile
+
+
+class SkinSet:
+    """
+    Named skins, warmed in the background.
+
+        >>> from PIL import Image
+        >>> from .skin import Skin
+        >>> from .dirstruct import Multi, Dir
+        >>> from .display import Display, DisplayImage
+
+        >>> skins = SkinSet({
+        ...     'large': Skin(Multi(Dir('images_d_tiles'), Dir('images'))),
+        ...     'small': Skin(Dir('images')),
+        ... })
+        >>> skins.wait() # Nothing scheduled yet, returns straight away
+        >>> skins.ready('small')
+        False
+        >>> skins.prewarm()
+        >>> skins.wait()
+        >>> skins.ready('small')
+        True
+        >>> sorted(skins.memory())
+        ['large', 'small']
+        >>> skins.memory()['small'] > 0
+        True
+
+        >>> display = Display(DisplayImage(None), skins['large'])
+        >>> skins.switch(display, 'small')
+        True
+        >>> display.tiles[0][0].size
+        (16, 16)
+        >>> skins['large'].cache = {} # Clean up for the sake of other tests
+    """
+    def __init__(self, skins, zoom=1):
+        self.zoom = zoom
+        self.skins = {name: (skin if skin.zoom == zoom else skin.zoomed(zoom))
+                      for name, skin in skins.items()}
+        self._ready = {name: threading.Event() for name in self.skins}
+        self._thread = None # The warming thread, once prewarm has started it
+
+    def __getitem__(self, name):
+        return self.skins[name]
+
+    def prewarm(self):
+        """ Starts loading every skin on a background thread, unless it already has """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._warm_all, name='pysweep-skins', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """ Waits for prewarm to finish, if it was started """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def ready(self, name):
+        return self._ready[name].is_set()
+
+    def _warm_all(self):
+        for name, skin in self.skins.items():
+            warm(skin)
+            self._ready[name].set()
+
+    def switch(self, display, name):
+        """
+        Switches display to the named skin, warming it first if it isn't yet.
+        Returns whether the display changed size.
+        """
+        if not self.ready(name):
+            warm(self.skins[name])
+            self._ready[name].set()
+        return display.set_skin(self.skins[name])
+
+    def memory(self):
+        """ Bytes of decoded pixels held for each skin """
+        return {name: skin_memory(skin) for name, skin in self.skins.items()}
+
+def warm(skin):
+    """ Decodes every image of skin and builds its sprite tables """
+    skin.preload_skin()
+    Tile.load_table(skin.board.tile)
+    Face.load_table(skin.panel.face)
+    Counter.load_digittable(skin.panel.lcounter.digit)
+    Counter.load_digittable(skin.panel.rcounter.digit)
+
+def skin_memory(skin):
+    """ Bytes of decoded pixels in the caches for skin (at its zoom) """
+    if skin.zoom == 1:
+        cache = skin.cache
+    else:
+        cache = skin.scaledcache.get(skin.zoom, {})
+    total = 0
+    for (source, path), img in list(cache.items()):
+        if source is skin._source:
+            total += img.size[0] * img.size[1] * len(img.getbands())
+    return total
+
+if __name__ == "__main__": # pragma: no cover
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)